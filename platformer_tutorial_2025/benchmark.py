@@ -0,0 +1,224 @@
+'''
+Micro-benchmark for entity memory use and per-entity update cost.
+
+"Before" numbers come from dict-backed copies of each class (a subclass without __slots__, so every instance carries a
+__dict__ like the classes used to), from building a fresh Rect each call, and from a copy of the old per-entity physics
+(see old_physics_update).
+The compositing rows compare a new upscaled surface and transition mask every frame with the Compositor's reused ones.
+The level rows load a level whole and streamed (from binary copies of the maps), then play it for a while with random input.
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import pygame
+from game import Game
+from scripts.clouds import Cloud
+from scripts.entities import Enemy, Player
+from scripts.headless import ScriptedInput
+from scripts.mapfile import MAP_EXTENSION
+from scripts.particle import Particle, ParticleSystem
+from scripts.physics import PhysicsWorld
+from scripts.projectile import EnemyProjectile
+from scripts.scene import MAP_PATH, GameplayScene
+from scripts.spark import Spark, SparkSystem
+from scripts.streaming import CHUNK_ARRAY_BYTES
+from scripts.tilemap import NEIGHBOR_OFFSETS, PHYSICS_TILES, Tilemap
+
+
+def dict_backed(cls):
+    # Same class, but instances get a __dict__ again
+    return type('Dict' + cls.__name__, (cls,), {})
+
+def instance_bytes(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def per_entity_us(func, count, repeat):
+    # Best time of a call that handles count entities, in microseconds per entity
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / count * 1000000
+
+def old_physics_rects_around(tiles, tile_size, pos):
+    # The old Tilemap.physics_rects_around, over its 'x;y' -> tile dict
+    rects = []
+    tile_loc = (int(pos[0] // tile_size), int(pos[1] // tile_size))
+    for offset in NEIGHBOR_OFFSETS:
+        check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+        if check_loc in tiles and tiles[check_loc]['type'] in PHYSICS_TILES:
+            rects.append(pygame.Rect(tiles[check_loc]['pos'][0] * tile_size, tiles[check_loc]['pos'][1] * tile_size, tile_size, tile_size))
+    return rects
+
+def old_physics_update(body, tiles, tile_size, movement=(0, 0)):
+    '''
+    PhysicsEntity.update's collision code as it used to be: tiles looked up in a 'x;y' dict, a new Rect per nearby physics
+    tile and per entity, and a fresh collisions dict every call. Animation isn't part of it, the batched step doesn't animate either
+    '''
+    body.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+    frame_movement = (movement[0] + body.velocity[0], movement[1] + body.velocity[1])
+
+    body.pos[0] += frame_movement[0]
+    entity_rect = pygame.Rect(body.pos[0], body.pos[1], body.size[0], body.size[1])
+    for rect in old_physics_rects_around(tiles, tile_size, body.pos):
+        if entity_rect.colliderect(rect):
+            if frame_movement[0] > 0:
+                entity_rect.right = rect.left
+                body.collisions['right'] = True
+            if frame_movement[0] < 0:
+                entity_rect.left = rect.right
+                body.collisions['left'] = True
+            body.pos[0] = entity_rect.x
+
+    body.pos[1] += frame_movement[1]
+    entity_rect = pygame.Rect(body.pos[0], body.pos[1], body.size[0], body.size[1])
+    for rect in old_physics_rects_around(tiles, tile_size, body.pos):
+        if entity_rect.colliderect(rect):
+            if frame_movement[1] > 0:
+                entity_rect.bottom = rect.top
+                body.collisions['down'] = True
+            if frame_movement[1] < 0:
+                entity_rect.top = rect.bottom
+                body.collisions['up'] = True
+            body.pos[1] = entity_rect.y
+
+    body.velocity[1] = min(5, body.velocity[1] + 0.1)
+    if body.collisions['down'] or body.collisions['up']:
+        body.velocity[1] = 0
+
+class OldBody:
+    # The physics state an entity used to carry around, in a __dict__
+    def __init__(self, pos, size):
+        self.pos = list(pos)
+        self.size = size
+        self.velocity = [0, 0]
+        self.collisions = {}
+
+def tilemap_bytes(tilemap):
+    # Chunk arrays + cached renders in memory, counted like the streamer counts its budget
+    surfs = [surf for surf in tilemap.render_cache.values() if surf is not None]
+    return len(tilemap.chunks) * CHUNK_ARRAY_BYTES + sum(surf.get_bytesize() * surf.get_width() * surf.get_height() for surf in surfs)
+
+
+# Parse arguments for the benchmark run
+parser = argparse.ArgumentParser(description='Entity memory and update cost micro-benchmark')
+parser.add_argument('--count', type=int, default=1000, help='Number of entities of each kind')
+parser.add_argument('--repeat', type=int, default=20, help='Timing repeats, the best one is reported')
+parser.add_argument('--level', type=int, default=0, help='Level for the load/streaming rows')
+parser.add_argument('--frames', type=int, default=600, help='Steps played after loading the level, before measuring memory again')
+args = parser.parse_args()
+
+random.seed(0)
+game = Game(headless=True)
+tilemap = game.state.tilemap
+factories = {
+    'Particle': lambda cls: cls(game, 'particle', (random.random() * 500, random.random() * 200), velocity=[random.random() - 0.5, random.random() - 0.5]),
+    'Spark': lambda cls: cls((random.random() * 500, random.random() * 200), random.random() * 6.28, 2 + random.random()),
+    'Cloud': lambda cls: cls((random.random() * 500, random.random() * 200), game.assets['clouds'][0], 0.05, 0.5),
+    'EnemyProjectile': lambda cls: cls(game, [random.random() * 500, random.random() * 200], 1.5, 0, 10),
+    'Enemy': lambda cls: cls(game, (random.random() * 500, random.random() * 200), (8, 15), 10, 10),
+    'Player': lambda cls: cls(game, (random.random() * 500, random.random() * 200), (8, 15)),
+}
+classes = {'Particle': Particle, 'Spark': Spark, 'Cloud': Cloud, 'EnemyProjectile': EnemyProjectile, 'Enemy': Enemy, 'Player': Player}
+
+print(f'{"Bytes per entity":<24}{"before":>10}{"after":>10}')
+for name, cls in classes.items():
+    before = instance_bytes(factories[name](dict_backed(cls)))
+    after = instance_bytes(factories[name](cls))
+    print(f'{name:<24}{before:>10}{after:>10}')
+
+print(f'\n{"Update (us per entity)":<24}{"before":>10}{"after":>10}')
+for name in ['Particle', 'Spark', 'Cloud']:
+    old = [factories[name](dict_backed(classes[name])) for i in range(args.count)]
+    new = [factories[name](classes[name]) for i in range(args.count)]
+    before = per_entity_us(lambda: [thing.update() for thing in old], args.count, args.repeat)
+    after = per_entity_us(lambda: [thing.update() for thing in new], args.count, args.repeat)
+    print(f'{name:<24}{before:>10.3f}{after:>10.3f}')
+
+# Particles: slotted Particle objects vs the NumPy ParticleSystem. Leaves, since their animation outlasts the repeats
+particles = [Particle(game, 'leaf', (random.random() * 500, random.random() * 200), velocity=[-0.1, 0.3]) for i in range(args.count)]
+system = ParticleSystem(game)
+for particle in particles:
+    system.spawn('leaf', particle.pos, velocity=particle.velocity)
+before = per_entity_us(lambda: [particle.update() for particle in particles], args.count, args.repeat)
+after = per_entity_us(system.update, args.count, args.repeat)
+print(f'{"ParticleSystem":<24}{before:>10.3f}{after:>10.3f}')
+
+# Sparks: Spark objects vs the NumPy SparkSystem, updating and building polygons (drawn to a throwaway surface)
+sparks = [Spark((random.random() * 500, random.random() * 200), random.random() * 6.28, 5) for i in range(args.count)] # Slow enough to outlast the default repeats
+spark_system = SparkSystem()
+for spark in sparks:
+    spark_system.spawn(spark.pos, spark.angle, spark.speed)
+canvas = pygame.Surface((500, 200))
+before = per_entity_us(lambda: [(spark.update(), spark.render(canvas)) for spark in sparks], args.count, args.repeat)
+after = per_entity_us(lambda: (spark_system.update(), spark_system.render(canvas)), args.count, args.repeat)
+print(f'{"SparkSystem":<24}{before:>10.3f}{after:>10.3f}')
+
+entities = [factories['Enemy'](Enemy) for i in range(args.count)]
+before = per_entity_us(lambda: [pygame.Rect(e.pos[0], e.pos[1], e.size[0], e.size[1]) for e in entities], args.count, args.repeat)
+after = per_entity_us(lambda: [e.rect() for e in entities], args.count, args.repeat)
+print(f'{"rect()":<24}{before:>10.3f}{after:>10.3f}')
+
+# Physics: entities stepped one at a time with the old update vs one shared world stepped as a batch
+tiles = {}
+for chunk in tilemap.chunks.values():
+    for x, y, type_id, variant in chunk.cells():
+        tiles[str(x) + ';' + str(y)] = {'type': tilemap.tile_types[type_id], 'variant': variant, 'pos': [x, y]} # The old tilemap dict
+bodies = [OldBody(entity.pos, entity.size) for entity in entities]
+world = PhysicsWorld()
+for entity in entities:
+    world.add(entity)
+slots = [entity.slot for entity in entities]
+movements = [(0, 0)] * len(entities)
+before = per_entity_us(lambda: [old_physics_update(body, tiles, tilemap.tile_size) for body in bodies], args.count, args.repeat)
+after = per_entity_us(lambda: world.step(tilemap, slots, movements), args.count, args.repeat)
+print(f'{"physics step":<24}{before:>10.3f}{after:>10.3f}')
+
+def fresh_transition(radius):
+    # How the transition mask used to be made, every frame
+    surf = pygame.Surface(game.display.get_size())
+    pygame.draw.circle(surf, (255, 255, 255), (game.display.get_width() // 2, game.display.get_height() // 2), radius)
+    surf.set_colorkey((255, 255, 255))
+    return surf
+
+print(f'\n{"Compositing (us/frame)":<24}{"before":>10}{"after":>10}')
+before = per_entity_us(lambda: pygame.transform.scale(game.display_2, game.screen.get_size()), 1, args.repeat)
+after = per_entity_us(lambda: game.compositor.upscale(game.display_2), 1, args.repeat)
+print(f'{"upscale":<24}{before:>10.3f}{after:>10.3f}')
+radii = [step * 8 for step in range(31)]
+before = per_entity_us(lambda: [game.display.blit(fresh_transition(radius), (0, 0)) for radius in radii], len(radii), args.repeat)
+after = per_entity_us(lambda: [game.display.blit(game.compositor.transition_mask(radius), (0, 0)) for radius in radii], len(radii), args.repeat)
+print(f'{"transition":<24}{before:>10.3f}{after:>10.3f}')
+
+# Level: loaded whole vs streamed around the camera. Only binary maps stream, so play from converted copies
+map_dir = tempfile.mkdtemp()
+converter = Tilemap(None)
+for name in os.listdir(MAP_PATH):
+    if name.endswith('.json'):
+        converter.load(os.path.join(MAP_PATH, name))
+        converter.save(os.path.join(map_dir, os.path.splitext(name)[0] + MAP_EXTENSION))
+
+rows = {'load ms': [], 'bytes after load': [], 'chunks after load': [], 'bytes after play': [], 'chunks after play': []}
+for streaming in [False, True]:
+    random.seed(0)
+    game.state = GameplayScene(game, args.level, streaming=streaming)
+    game.state.map_dir = map_dir
+    rows['load ms'].append(min(timeit.repeat(lambda: game.state.load_level(args.level), number=1, repeat=5)) * 1000)
+    rows['bytes after load'].append(tilemap_bytes(game.state.tilemap))
+    rows['chunks after load'].append(len(game.state.tilemap.chunks))
+    game.simulate(args.frames, inputs=ScriptedInput.random(args.frames, seed=0))
+    rows['bytes after play'].append(tilemap_bytes(game.state.tilemap))
+    rows['chunks after play'].append(len(game.state.tilemap.chunks))
+    if streaming:
+        streamer_stats = game.state.tilemap.streamer.stats()
+    game.state.tilemap.clear()
+
+print(f'\n{"Level " + str(args.level):<24}{"whole":>10}{"streamed":>10}')
+for name, (whole, streamed) in rows.items():
+    digits = 3 if name == 'load ms' else 0
+    print(f'{name:<24}{whole:>10.{digits}f}{streamed:>10.{digits}f}')
+print(f'Streamer after play: {streamer_stats}')
\ No newline at end of file
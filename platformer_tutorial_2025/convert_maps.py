@@ -0,0 +1,22 @@
+'''
+Convert json maps into the binary map format (see scripts/mapfile.py)
+'''
+
+import argparse
+import os
+
+from scripts.mapfile import MAP_EXTENSION
+from scripts.tilemap import Tilemap
+
+
+# Parse arguments for the maps to convert
+parser = argparse.ArgumentParser(description='Convert json maps to the binary map format')
+parser.add_argument('map_files', type=str, nargs='+', help='Paths to the json map files to convert. Each is written next to the original with a ' + MAP_EXTENSION + ' extension')
+args = parser.parse_args()
+
+tilemap = Tilemap(None) # Assets are only needed for rendering
+for map_file in args.map_files:
+    out_file = os.path.splitext(map_file)[0] + MAP_EXTENSION
+    tilemap.load(map_file)
+    tilemap.save(out_file)
+    print(f'{map_file} ({os.path.getsize(map_file)} bytes) -> {out_file} ({os.path.getsize(out_file)} bytes)')
@@ -50,6 +50,7 @@ class Editor: # Manage game settings
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
+        self.autotiling = False # Autotile around each tile as it's placed/removed
 
     def run(self):
         # Game Loop
@@ -76,16 +77,16 @@ class Editor: # Manage game settings
                 self.display.blit(current_tile_img, mpos)
 
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                current_tile = self.tilemap.tile_at(tile_pos)
+                if not (self.autotiling and current_tile and current_tile['type'] == self.tile_list[self.tile_group]): # Don't undo the autotiled variant every frame the mouse is held
+                    self.tilemap.set_tile(tile_pos, self.tile_list[self.tile_group], self.tile_variant)
+                    if self.autotiling:
+                        self.tilemap.autotile_around(tile_pos)
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy(): # Deleting offgrid tiles
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                if self.tilemap.remove_tile(tile_pos) and self.autotiling:
+                    self.tilemap.autotile_around(tile_pos)
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])): # Deleting offgrid tiles under the cursor
+                    self.tilemap.remove_offgrid(tile)
 
 
             
@@ -98,7 +99,7 @@ class Editor: # Manage game settings
                     if event.button == 1: # Left click
                         self.clicking = True
                         if not self.ongrid: # Putting this here so the offgrid placement only happens once per click
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
+                            self.tilemap.add_offgrid({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
                     if event.button == 3: # Right click
                         self.right_clicking = True
                     if self.shift:
@@ -135,6 +136,8 @@ class Editor: # Manage game settings
                         self.tilemap.save(self.map)
                     if event.key == pygame.K_t:
                         self.tilemap.autotile()
+                    if event.key == pygame.K_y: # Toggle live autotiling while painting
+                        self.autotiling = not self.autotiling
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
                 if event.type == pygame.KEYUP:
@@ -2,25 +2,50 @@ import pygame
 import math
 import os
 import random
+from scripts.compositor import Compositor, TRANSITION_STEP
 from scripts.entities import Enemy, PhysicsEntity, Player
+from scripts.governor import EffectsGovernor
+from scripts.headless import SilentSound, use_dummy_drivers
+from scripts.outline import Outlines, mask_outline
 from scripts.particle import Particle
+from scripts.projectile import RotationCache
 from scripts.scene import Scene, GameplayScene, PauseScene
 from scripts.spark import Spark
+from scripts.ui import UILayer
 from scripts.utils import load_image, load_images, Animation
 import sys
+import time
+
+SIM_FPS = 60 # Simulation steps per second. All movement/physics values are tuned per step
+TIMESTEP = 1 / SIM_FPS
+RENDER_FPS = 60 # Rendered frames per second cap, 0 for uncapped
+DISPLAY_SIZE = (320, 240) # Resolution the game is drawn at
+SCALE = 2 # Whole number the display is scaled up by for the window. Bigger windows just need a bigger number
+OUTLINE_MODE = 'cached' # 'cached' draws a prebuilt outline per sprite, 'mask' the old full screen mask pass. F4 switches in game to compare
+DIRTY_RECTS = True # While paused, present only the pause screen, once. False presents everything every frame. Gameplay always presents the whole window
+MAX_STEPS_PER_FRAME = 5 # Most simulation steps run to catch up before a frame is rendered. Time past that is dropped (the game slows down instead of freezing)
 
 class Game: # Manage game settings
-    def __init__(self):
-        pygame.mixer.pre_init(44100, -16, 2, 128) # Lower buffer for mixer to improve latency
+    def __init__(self, headless=False):
+        self.headless = headless # No window, no sound. For running simulations with simulate()
+        if self.headless:
+            use_dummy_drivers()
+        else:
+            pygame.mixer.pre_init(44100, -16, 2, 128) # Lower buffer for mixer to improve latency
         pygame.init() # Initialize pygame resources
 
         pygame.display.set_caption('Ninja Game') # Set window name
-        self.screen = pygame.display.set_mode((640, 480)) # Creating the window for the game
-        self.display = pygame.Surface((320, 240), pygame.SRCALPHA) # What I render to. We scale this up to the window size later to multiply the size of all our assets
-        self.display_2 = pygame.Surface((320, 240)) # For content that should NOT have outline (e.g., Background assets)
-        self.ui_display = pygame.Surface((640, 480), pygame.SRCALPHA) # For UI elements that are static on screen
+        self.compositor = Compositor(DISPLAY_SIZE, SCALE) # Scales the display up to the window and builds the transition masks
+        self.screen = pygame.display.set_mode(self.compositor.window_size) # Creating the window for the game
+        self.display = pygame.Surface(DISPLAY_SIZE, pygame.SRCALPHA) # What I render to. We scale this up to the window size later to multiply the size of all our assets
+        self.display_2 = pygame.Surface(DISPLAY_SIZE) # For content that should NOT have outline (e.g., Background assets)
+        self.ui_display = pygame.Surface(self.compositor.window_size, pygame.SRCALPHA) # For UI elements that are static on screen
+        self.ui = UILayer(self.ui_display) # Widgets shown on ui_display, which is only redrawn when one of them changes
+        self.outlines = Outlines(self.display_2, enabled=OUTLINE_MODE == 'cached') # Outlines of everything drawn to display go under it, on display_2
 
         self.clock = pygame.time.Clock() # Used to force the game to run at X FPS
+        self.dirty_rects = [] # Areas of the screen changed since the last present()
+        self.governor = EffectsGovernor() # Scales effects down on slow machines. Only fed frame times by run(), so simulations stay at full quality
 
         self.assets = {
             'decor' : load_images('tiles/decor'),
@@ -42,19 +67,22 @@ class Game: # Manage game settings
             'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
             'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
             'gun': load_image('gun.png'),
+            'gun/flipped': pygame.transform.flip(load_image('gun.png'), True, False), # Pre-flipped for enemies facing left
             'projectile': load_image('projectile.png'),
             'shuriken': load_image('shuriken.png', resize=True)
         }
+        self.assets['shuriken/rotations'] = RotationCache(self.assets['shuriken']) # The shuriken spins, every angle is rendered here once
 
         # Setting sound affects
+        Sound = SilentSound if self.headless else pygame.mixer.Sound
         self.sfx = {
-            'jump': pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('data/sfx/dash.wav'),
-            'hit': pygame.mixer.Sound('data/sfx/hit.wav'),
-            'shoot': pygame.mixer.Sound('data/sfx/shoot.wav'),
-            'ambience': pygame.mixer.Sound('data/sfx/ambience.wav'),
-            'special_attack': pygame.mixer.Sound('data/sfx/special_attack.wav'),
-            'special_attack_charged': pygame.mixer.Sound('data/sfx/special_attack_charged.wav')
+            'jump': Sound('data/sfx/jump.wav'),
+            'dash': Sound('data/sfx/dash.wav'),
+            'hit': Sound('data/sfx/hit.wav'),
+            'shoot': Sound('data/sfx/shoot.wav'),
+            'ambience': Sound('data/sfx/ambience.wav'),
+            'special_attack': Sound('data/sfx/special_attack.wav'),
+            'special_attack_charged': Sound('data/sfx/special_attack_charged.wav')
         }
 
         self.sfx['ambience'].set_volume(0.2)
@@ -74,38 +102,42 @@ class Game: # Manage game settings
 
     def update(self):
         '''
-        Handle per-frame logic updates
+        Handle a single fixed simulation step
         '''
-
-        # Add basic background fill and asset
-        self.display.fill((0, 0, 0, 0))
-        self.display_2.fill((93, 93, 93, 0))
-        if self.state.level != 0:
-            self.display_2.blit(self.assets['background'], (0, 0)) # Default screen background
-        self.ui_display.fill((0, 0, 0, 0))
-        
         # Update Screenshake
         self.screenshake = max(0, self.screenshake - 1)
 
         # Calculate camera position and offset for future object placement
+        self.prev_scroll = list(self.scroll) # Camera position before this step, for interpolation
         self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30 # The camera position is the top-left. So we need to subtract the screen size to center the player
         self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30 # The camera position is the top-left. So we need to subtract the screen size to center the player
-        render_scroll = (int(self.scroll[0]), int(self.scroll[1])) # Solves sub-pixel camera jittering by using int rounding/truncation
 
         self.state.update()
-        self.state.render(render_scroll)
 
-        # Handle outlining
-        display_mask = pygame.mask.from_surface(self.display)
-        display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor = (0, 0, 0, 0))
-        for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            self.display_2.blit(display_sillhouette, offset)
+    def draw(self, alpha=1):
+        '''
+        Draw the world, alpha of the way from the previous simulation step to the latest one
+        '''
+        # Add basic background fill and asset
+        self.display.fill((0, 0, 0, 0))
+        self.display_2.fill((93, 93, 93, 0))
+        if self.state.level != 0:
+            self.display_2.blit(self.assets['background'], (0, 0)) # Default screen background
+
+        scroll = (self.prev_scroll[0] + (self.scroll[0] - self.prev_scroll[0]) * alpha, self.prev_scroll[1] + (self.scroll[1] - self.prev_scroll[1]) * alpha)
+        render_scroll = (int(scroll[0]), int(scroll[1])) # Solves sub-pixel camera jittering by using int rounding/truncation
+        self.state.render(render_scroll, alpha=alpha)
+        self.ui.render()
 
-    def handle_input(self):
+        # Handle outlining. Cached outlines were already drawn along with each sprite
+        if not self.outlines.enabled:
+            mask_outline(self.display, self.display_2)
+
+    def handle_input(self, events=None):
         '''
-        Handle user input
+        Handle user input. Takes events from pygame's queue unless a list of events is given
         '''
-        for event in pygame.event.get(): # event is where the... events get stored
+        for event in pygame.event.get() if events is None else events: # event is where the... events get stored
             if event.type == pygame.QUIT: # Clicking the 'x' in the window
                 pygame.quit()
                 sys.exit()
@@ -121,6 +153,11 @@ class Game: # Manage game settings
                     self.player.shuriken()
                 if event.key == pygame.K_x:
                     self.player.dash()
+                if event.key == pygame.K_F3:
+                    print(f'EFFECTS: {self.governor.stats()}')
+                if event.key == pygame.K_F4:
+                    self.outlines.enabled = not self.outlines.enabled
+                    print(f'OUTLINES: {"cached" if self.outlines.enabled else "mask"}')
                 if event.key == pygame.K_ESCAPE:
                     self.pause_state.pause()
                     self.state.movement = [False, False]
@@ -133,14 +170,7 @@ class Game: # Manage game settings
     def render(self):
         # Handle transition effect
         if self.state.transition:
-            transition_surf = pygame.Surface(self.display.get_size())
-            pygame.draw.circle(transition_surf, 
-                (255, 255, 255), 
-                (self.display.get_width() // 2, self.display.get_height() // 2), 
-                (30 - abs(self.state.transition)) * 8
-            )
-            transition_surf.set_colorkey((255, 255, 255))
-            self.display.blit(transition_surf, (0, 0))
+            self.display.blit(self.compositor.transition_mask((30 - abs(self.state.transition)) * TRANSITION_STEP), (0, 0))
 
         # Blit display over background
         self.display_2.blit(self.display, (0, 0))
@@ -149,15 +179,30 @@ class Game: # Manage game settings
         screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
 
         # Put all displays onto the screen
-        self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset) # Where the resizing happens for the pixel art
+        self.screen.blit(self.compositor.upscale(self.display_2), screenshake_offset) # Where the resizing happens for the pixel art
+        self.mark_dirty(self.screen.get_rect()) # Gameplay frames always present the whole window. Clouds, falling leaves and entities move even when the camera is still, so the HUD and transition areas are never the only change
 
-        # Put UI on the screen
-        self.screen.blit(self.ui_display, (0, 0))
+        # Put UI on the screen. Only where there are widgets, the rest of ui_display is empty
+        for rect in self.ui.rects:
+            self.screen.blit(self.ui_display, rect, rect)
 
         # Render pause menu
         if self.pause_state.is_paused:
             self.pause_state.render()
 
+    def mark_dirty(self, rect):
+        self.dirty_rects.append(rect)
+
+    def present(self):
+        '''
+        Show what changed on the screen surface in the window
+        '''
+        if not DIRTY_RECTS:
+            pygame.display.update()
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+        self.dirty_rects.clear()
+
     def run(self):
         # Play the background music
         pygame.mixer.music.load('data/music.wav')
@@ -167,18 +212,54 @@ class Game: # Manage game settings
         self.sfx['ambience'].play(-1)
 
         # Game Loop
+        # The simulation runs in fixed steps of TIMESTEP, as many as the real time passed calls for, and rendering
+        # interpolates between the last two steps. Slow frames don't slow gameplay down and the frame rate can differ from SIM_FPS
+        accumulator = 0
         while True:
-
+            accumulator += self.clock.tick(RENDER_FPS) / 1000 # Limits the frame rate to RENDER_FPS
             if self.pause_state.is_paused:
                 self.pause_state.update()
                 self.pause_state.handle_input()
+                accumulator = 0
+                if DIRTY_RECTS:
+                    # The last frame is still on the screen surface, so only the pause screen needs drawing, once
+                    if not self.pause_state.shown:
+                        self.pause_state.render()
+                else:
+                    self.draw()
+                    self.render()
             else:
-                self.update()
+                self.governor.record(self.clock.get_rawtime()) # Work time of the last frame, without the wait for the frame cap
                 self.handle_input()
-            self.render()
+                steps = 0
+                while accumulator >= TIMESTEP and steps < MAX_STEPS_PER_FRAME and not self.pause_state.is_paused: # Input can pause the game, don't step past that
+                    self.update()
+                    accumulator -= TIMESTEP
+                    steps += 1
+                if steps == MAX_STEPS_PER_FRAME: # Too far behind to catch up, drop the rest
+                    accumulator = min(accumulator, TIMESTEP)
+                alpha = min(accumulator / TIMESTEP, 1)
+                self.draw(alpha)
+                self.render()
 
-            pygame.display.update() # Updates the display
-            self.clock.tick(60) # Limits the game to 60 FPS
+            self.present() # Updates the display
+
+    def simulate(self, frames, inputs=None, render=False):
+        '''
+        Run the given number of simulation steps as fast as possible, fed by a ScriptedInput (or no input at all).
+
+        Rendering is skipped unless asked for. Returns the number of steps run per second.
+        '''
+        start = time.perf_counter()
+        for frame in range(frames):
+            self.handle_input(inputs.events(frame) if inputs is not None else [])
+            if not self.pause_state.is_paused:
+                self.update()
+            if render:
+                self.draw()
+                self.render()
+        return frames / max(time.perf_counter() - start, 0.000001)
         
 
-Game().run()
\ No newline at end of file
+if __name__ == '__main__':
+    Game().run()
\ No newline at end of file
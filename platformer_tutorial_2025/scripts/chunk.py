@@ -0,0 +1,58 @@
+from array import array
+
+CHUNK_SHIFT = 4 # Chunks are 2^CHUNK_SHIFT tiles wide/tall
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1 # Bitmask for the tile position inside of a chunk
+CHUNK_CELLS = CHUNK_SIZE * CHUNK_SIZE
+
+EMPTY = 0 # Type id reserved for cells without a tile
+
+def chunk_coords(x, y):
+    # Shifting floors negative numbers too, so -1 lands in chunk -1 (not 0)
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+
+def cell_index(x, y):
+    # Index of a tile position inside of its chunk's flat arrays (row-major)
+    return ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+
+class Chunk:
+    '''
+    A fixed-size square of grid tiles stored as flat typed arrays.
+
+    Each cell holds a type id (an index into the owning Tilemap's type table) and a variant.
+    A type id of EMPTY means there is no tile in that cell.
+    '''
+    def __init__(self, cx, cy, types=None, variants=None):
+        self.cx = cx # Chunk coordinates (in chunks, not tiles)
+        self.cy = cy
+        self.types = types if types is not None else array('H', bytes(2 * CHUNK_CELLS))
+        self.variants = variants if variants is not None else array('H', bytes(2 * CHUNK_CELLS))
+        self.count = CHUNK_CELLS - self.types.count(EMPTY) # Number of non-empty cells, lets the Tilemap drop empty chunks
+
+    def origin(self):
+        # Tile position of the top-left cell
+        return (self.cx << CHUNK_SHIFT, self.cy << CHUNK_SHIFT)
+
+    def set(self, index, type_id, variant):
+        if self.types[index] == EMPTY:
+            self.count += 1
+        self.types[index] = type_id
+        self.variants[index] = variant
+
+    def clear(self, index):
+        # Returns True if there was a tile to remove
+        if self.types[index] == EMPTY:
+            return False
+        self.types[index] = EMPTY
+        self.variants[index] = 0
+        self.count -= 1
+        return True
+
+    def cells(self):
+        # Yield (tile x, tile y, type id, variant) for every non-empty cell
+        ox, oy = self.origin()
+        types = self.types
+        variants = self.variants
+        for index in range(CHUNK_CELLS):
+            if types[index] != EMPTY:
+                yield (ox + (index & CHUNK_MASK), oy + (index >> CHUNK_SHIFT), types[index], variants[index])
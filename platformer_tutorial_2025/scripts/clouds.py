@@ -1,6 +1,8 @@
 import random
 
 class Cloud:
+    __slots__ = ('pos', 'img', 'speed', 'depth')
+
     def __init__(self, pos, img, speed, depth):
         self.pos = list(pos)
         self.img = img
@@ -28,6 +30,12 @@ class Clouds:
         for cloud in self.clouds:
             cloud.update()
     
-    def render(self, surf, offset=(0, 0)):
-        for cloud in self.clouds:
-            cloud.render(surf, offset=offset)
\ No newline at end of file
+    def render(self, surf, offset=(0, 0), count=None):
+        # count limits how many clouds are drawn. They're picked evenly from the depth-sorted list, so every depth keeps some
+        if count is None or count >= len(self.clouds):
+            for cloud in self.clouds:
+                cloud.render(surf, offset=offset)
+            return
+        step = len(self.clouds) / count
+        for i in range(count):
+            self.clouds[int(i * step)].render(surf, offset=offset)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import numpy as np
+import pygame
+from scripts.chunk import CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE
+
+BUCKET_SHIFT = 2 # Collision buckets are 2^BUCKET_SHIFT tiles wide/tall
+BUCKET_SIZE = 1 << BUCKET_SHIFT
+NO_SOLIDS = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=bool) # Solid cells of a spot with no chunk, shared
+
+def greedy_mesh(chunk, solid_ids, tile_size):
+    '''
+    Merge the solid cells of a chunk into as few rects as possible.
+
+    Runs of solid cells are grown to the right first, then downward for as long as every cell under the run is solid too.
+    '''
+    solid = [type_id in solid_ids for type_id in chunk.types]
+    used = [False] * len(solid)
+    origin_x, origin_y = chunk.cx * CHUNK_SIZE, chunk.cy * CHUNK_SIZE
+    rects = []
+    for y in range(CHUNK_SIZE):
+        for x in range(CHUNK_SIZE):
+            index = (y << CHUNK_SHIFT) | x
+            if not solid[index] or used[index]:
+                continue
+            width = 1
+            while x + width < CHUNK_SIZE and solid[index + width] and not used[index + width]:
+                width += 1
+            height = 1
+            while y + height < CHUNK_SIZE:
+                row = ((y + height) << CHUNK_SHIFT) | x
+                if not all(solid[row + i] and not used[row + i] for i in range(width)):
+                    break
+                height += 1
+            for row_y in range(y, y + height):
+                for row_x in range(x, x + width):
+                    used[(row_y << CHUNK_SHIFT) | row_x] = True
+            rects.append(pygame.Rect((origin_x + x) * tile_size, (origin_y + y) * tile_size, width * tile_size, height * tile_size))
+    return rects
+
+class CollisionMap:
+    '''
+    Merged collision geometry for a Tilemap's physics tiles.
+
+    Each chunk's solid cells are greedy-meshed into a few large rects. Those rects are then sorted into small buckets:
+    a bucket holds every rect touching the bucket or the tile ring around it, so a single lookup gives everything
+    near a position. The rects and bucket tuples are reused until a tile in their area changes.
+
+    A bool array of solid cells is kept per chunk as well, for NumPy code that checks many positions at once (see
+    PhysicsWorld). Both are only made for chunks that get used, and dropped again when a streamed chunk is evicted.
+    '''
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.chunk_rects = {} # Chunk coordinates -> merged rects for that chunk
+        self.buckets = {} # Bucket coordinates -> tuple of rects near that bucket
+        self.solid = {} # Chunk coordinates -> bool array of its physics cells, indexed [y, x]. Built on first use, see solid_at()
+
+    def clear(self):
+        self.chunk_rects = {}
+        self.buckets = {}
+        self.solid = {}
+
+    def rects_in_chunk(self, coords):
+        if coords not in self.chunk_rects:
+            chunk = self.tilemap.get_chunk(coords)
+            self.chunk_rects[coords] = greedy_mesh(chunk, self.tilemap.physics_ids, self.tilemap.tile_size) if chunk is not None else []
+        return self.chunk_rects[coords]
+
+    def build_bucket(self, bx, by):
+        tile_size = self.tilemap.tile_size
+        bucket_px = BUCKET_SIZE * tile_size
+        area = pygame.Rect(bx * bucket_px - tile_size, by * bucket_px - tile_size, bucket_px + tile_size * 2, bucket_px + tile_size * 2) # Bucket + 1 tile border, to cover the neighbors of any tile in the bucket
+        rects = []
+        # Tile border means the area can reach into the surrounding chunks
+        for cx in range(((bx << BUCKET_SHIFT) - 1) >> CHUNK_SHIFT, (((bx + 1) << BUCKET_SHIFT) >> CHUNK_SHIFT) + 1):
+            for cy in range(((by << BUCKET_SHIFT) - 1) >> CHUNK_SHIFT, (((by + 1) << BUCKET_SHIFT) >> CHUNK_SHIFT) + 1):
+                for rect in self.rects_in_chunk((cx, cy)):
+                    if area.colliderect(rect):
+                        rects.append(rect)
+        self.buckets[(bx, by)] = tuple(rects)
+        return self.buckets[(bx, by)]
+
+    def solid_chunk(self, coords):
+        if coords not in self.solid:
+            chunk = self.tilemap.get_chunk(coords)
+            if chunk is None:
+                self.solid[coords] = NO_SOLIDS
+            else:
+                solid_ids = np.array(sorted(self.tilemap.physics_ids), dtype=np.uint16)
+                self.solid[coords] = np.isin(np.frombuffer(chunk.types, dtype=np.uint16), solid_ids).reshape(CHUNK_SIZE, CHUNK_SIZE)
+        return self.solid[coords]
+
+    def solid_at(self, tile_x, tile_y):
+        # Bool array, True where the cell at (tile_x[i], tile_y[i]) is a physics tile
+        if not len(tile_x):
+            return np.zeros(0, dtype=bool)
+        cx = tile_x >> CHUNK_SHIFT
+        cy = tile_y >> CHUNK_SHIFT
+        # Positions are usually spread over only a few chunks, so look each of those up once and index them all together
+        codes, first, which = np.unique((cx << 32) | (cy & 0xFFFFFFFF), return_index=True, return_inverse=True)
+        blocks = np.stack([self.solid_chunk(coords) for coords in zip(cx[first].tolist(), cy[first].tolist())])
+        return blocks[which.ravel(), tile_y & CHUNK_MASK, tile_x & CHUNK_MASK]
+
+    def build(self, area=None):
+        '''
+        Mesh every loaded chunk (or the chunk coordinates in area) and fill the buckets covering them, so levels don't do this work mid-play
+        '''
+        buckets_per_chunk = CHUNK_SIZE >> BUCKET_SHIFT
+        for cx, cy in list(self.tilemap.chunks) if area is None else area:
+            self.solid_chunk((cx, cy))
+            for bx in range(cx * buckets_per_chunk, (cx + 1) * buckets_per_chunk):
+                for by in range(cy * buckets_per_chunk, (cy + 1) * buckets_per_chunk):
+                    if (bx, by) not in self.buckets:
+                        self.build_bucket(bx, by)
+
+    def rects_around(self, pos):
+        # Every merged rect near a pixel position. The tuple and its rects are shared, so don't modify them
+        tile_size = self.tilemap.tile_size
+        coords = (int(pos[0] // tile_size) >> BUCKET_SHIFT, int(pos[1] // tile_size) >> BUCKET_SHIFT)
+        if coords in self.buckets:
+            return self.buckets[coords]
+        return self.build_bucket(coords[0], coords[1])
+
+    def invalidate_cell(self, x, y):
+        # Called when a cell changes between solid and not solid
+        coords = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        self.chunk_rects.pop(coords, None)
+        self.solid.pop(coords, None)
+        # Any bucket that pulled rects from this chunk is stale too
+        first_x, first_y = ((coords[0] << CHUNK_SHIFT) - 1) >> BUCKET_SHIFT, ((coords[1] << CHUNK_SHIFT) - 1) >> BUCKET_SHIFT
+        last_x, last_y = ((coords[0] + 1) << CHUNK_SHIFT) >> BUCKET_SHIFT, ((coords[1] + 1) << CHUNK_SHIFT) >> BUCKET_SHIFT
+        for bx in range(first_x, last_x + 1):
+            for by in range(first_y, last_y + 1):
+                self.buckets.pop((bx, by), None)
+
+    def evict_chunk(self, coords):
+        # Called when a streamed chunk leaves memory. Buckets around it are still right and stay, only what's inside goes
+        self.chunk_rects.pop(coords, None)
+        self.solid.pop(coords, None)
+        buckets_per_chunk = CHUNK_SIZE >> BUCKET_SHIFT
+        for bx in range(coords[0] * buckets_per_chunk, (coords[0] + 1) * buckets_per_chunk):
+            for by in range(coords[1] * buckets_per_chunk, (coords[1] + 1) * buckets_per_chunk):
+                self.buckets.pop((bx, by), None)
\ No newline at end of file
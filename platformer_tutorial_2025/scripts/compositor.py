@@ -0,0 +1,33 @@
+import pygame
+
+TRANSITION_STEP = 8 # Pixels the transition circle's radius changes per step of the level transition
+
+class Compositor:
+    '''
+    Puts the low resolution display on the window without allocating anything per frame.
+
+    The display is scaled up by a whole number into a surface made once, and the circular level transition masks are
+    built the first time each radius is used and then reused.
+    '''
+    def __init__(self, display_size, scale):
+        self.display_size = display_size
+        self.scale = scale
+        self.window_size = (display_size[0] * scale, display_size[1] * scale)
+        self.scaled = None # Made on first upscale(), in the display's pixel format
+        self.transitions = {} # Radius -> transition mask
+
+    def upscale(self, surf):
+        if self.scaled is None:
+            self.scaled = pygame.Surface(self.window_size, 0, surf) # scale() needs a destination in the same format
+        return pygame.transform.scale(surf, self.window_size, self.scaled)
+
+    def transition_mask(self, radius):
+        '''
+        Black everywhere but a circle of the given radius in the middle, which is transparent (colorkeyed)
+        '''
+        if radius not in self.transitions:
+            mask = pygame.Surface(self.display_size)
+            pygame.draw.circle(mask, (255, 255, 255), (self.display_size[0] // 2, self.display_size[1] // 2), radius)
+            mask.set_colorkey((255, 255, 255))
+            self.transitions[radius] = mask
+        return self.transitions[radius]
\ No newline at end of file
@@ -0,0 +1,51 @@
+class EntityList:
+    '''
+    A list of entities with deferred removal.
+
+    kill() only marks an entity as dead, so it's safe to call while iterating, and iteration skips the marked ones.
+    compact() then drops every dead entity in a single in-place pass (keeping draw order), once per frame, instead of a
+    list.remove per death plus a copy of the list per loop. on_remove is called for each entity compact() or clear() drops.
+    '''
+    def __init__(self, on_remove=None):
+        self.items = []
+        self.dead = set()
+        self.on_remove = on_remove
+
+    def __len__(self):
+        return len(self.items) - len(self.dead)
+
+    def __iter__(self):
+        items = self.items
+        dead = self.dead
+        for i in range(len(items)): # Entities added mid-iteration wait for the next pass
+            item = items[i]
+            if item not in dead:
+                yield item
+
+    def append(self, item):
+        self.items.append(item)
+
+    def kill(self, item):
+        self.dead.add(item)
+
+    def compact(self):
+        if not self.dead:
+            return
+        items = self.items
+        kept = 0
+        for item in items:
+            if item in self.dead:
+                if self.on_remove:
+                    self.on_remove(item)
+            else:
+                items[kept] = item
+                kept += 1
+        del items[kept:]
+        self.dead.clear()
+
+    def clear(self):
+        if self.on_remove:
+            for item in self.items:
+                self.on_remove(item)
+        self.items.clear()
+        self.dead.clear()
\ No newline at end of file
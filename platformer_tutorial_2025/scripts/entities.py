@@ -1,18 +1,24 @@
 import math
 import pygame
-from scripts.particle import Particle
+from scripts.physics import DOWN, GRAVITY, LEFT, MAX_FALL_SPEED, RIGHT, UP
 from scripts.projectile import EnemyProjectile, PlayerShuriken
-from scripts.spark import Spark
+from scripts.ui import ShurikenWidget
 import random
 
 class PhysicsEntity:
+    # Fixed attribute layout (no per-instance __dict__), since scenes can hold hundreds of these
+    __slots__ = ('game', 'type', 'pos', 'size', 'velocity', 'collisions', 'world', 'slot', 'hitbox', 'action', 'anim_offset', 'flip', 'animation', 'last_movement')
+
     def __init__ (self, game, e_type, pos, size):
         self.game = game
         self.type = e_type
         self.pos = list(pos)
         self.size = size
         self.velocity = [0, 0]
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+        self.collisions = 0 # Bitfield of the UP/DOWN/LEFT/RIGHT flags from scripts.physics
+        self.hitbox = pygame.Rect(0, 0, size[0], size[1]) # Reused by rect()
+        self.world = None # PhysicsWorld holding this entity's state, see PhysicsWorld.add()
+        self.slot = None
         
         self.action = ''
         self.anim_offset = (-3, -3) # Buffer space for animation images to exceed the "hitbox" of the entity
@@ -21,8 +27,20 @@ class PhysicsEntity:
         self.last_movement = [0, 0]
 
     def rect(self):
-        return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+        # The same Rect every call, moved to the current position. Copy it to keep it around
+        self.hitbox.x = self.pos[0]
+        self.hitbox.y = self.pos[1]
+        return self.hitbox
     
+    def render_offset(self, offset, alpha):
+        '''
+        Camera offset that makes render() draw this entity alpha of the way between its last two physics steps
+        '''
+        if self.world is None:
+            return offset
+        pos = self.world.interpolated(self.slot, alpha)
+        return (offset[0] + self.pos[0] - pos[0], offset[1] + self.pos[1] - pos[1])
+
     def set_action(self, action):
         # Reset the action for the entity, including the animation loop
         if action != self.action:
@@ -30,33 +48,50 @@ class PhysicsEntity:
             self.animation = self.game.assets[self.type + '/' + self.action].copy()
 
     def update(self, tilemap, movement=(0, 0)):
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False} # Reset collision record
-        frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1]) # Every frame we add velocity
+        # Step just this entity. Scenes step groups of entities through PhysicsWorld.step() instead, which does the same
+        # thing with arrays. For a single entity plain Python against the merged collision rects is cheaper
+        collisions = 0
+        frame_movement_x = movement[0] + self.velocity[0] # Every frame we add velocity
+        frame_movement_y = movement[1] + self.velocity[1]
 
-        self.pos[0] += frame_movement[0]
+        self.pos[0] += frame_movement_x
         entity_rect = self.rect()
         for rect in tilemap.physics_rects_around(self.pos):
             if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0: # Movement to the right gets blocked, so snap left
+                if frame_movement_x > 0: # Movement to the right gets blocked, so snap left
                     entity_rect.right = rect.left
-                    self.collisions['right'] = True
-                if frame_movement[0] < 0: # Movement to the left gets blocked, so snap right
+                    collisions |= RIGHT
+                if frame_movement_x < 0: # Movement to the left gets blocked, so snap right
                     entity_rect.left = rect.right
-                    self.collisions['left'] = True
+                    collisions |= LEFT
                 self.pos[0] = entity_rect.x
 
-        self.pos[1] += frame_movement[1]
+        self.pos[1] += frame_movement_y
         entity_rect = self.rect()
         for rect in tilemap.physics_rects_around(self.pos):
             if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0: # Movement to the bottom gets blocked, so snap up
+                if frame_movement_y > 0: # Movement to the bottom gets blocked, so snap up
                     entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
-                if frame_movement[1] < 0: # Movement to the top gets blocked, so snap down
+                    collisions |= DOWN
+                if frame_movement_y < 0: # Movement to the top gets blocked, so snap down
                     entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
+                    collisions |= UP
                 self.pos[1] = entity_rect.y
-        
+
+        self.collisions = collisions
+        if self.world is not None:
+            self.world.collisions[self.slot] = collisions
+
+        self.velocity[1] = min(MAX_FALL_SPEED, self.velocity[1] + GRAVITY) # Apply gravity acceleration after the movement has been calculated
+        if collisions & (UP | DOWN): # Reset velocity when up/down contact has been made
+            self.velocity[1] = 0
+
+        return self.after_physics(movement)
+
+    def after_physics(self, movement):
+        '''
+        Per-entity work once the physics step (batched or not) has moved this entity
+        '''
         # Handle flipping the graphic when facing left (assets are facing the right)
         if movement[0] > 0:
             self.flip = False
@@ -65,18 +100,18 @@ class PhysicsEntity:
 
         self.last_movement = movement
 
-        self.velocity[1] = min(5, self.velocity[1] + 0.1) # Apply gravity acceleration after the movement has been calculated 
-
-        if self.collisions['down'] or self.collisions['up']: # Reset veloicty when up/down contact has been made
-            self.velocity[1] = 0
-
         self.animation.update()
 
     def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        img = self.animation.img(flip=self.flip)
+        pos = (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1])
+        surf.blit(img, pos)
+        self.game.outlines.draw(img, pos)
 
 
 class Enemy(PhysicsEntity):
+    __slots__ = ('health', 'damage', 'i_window', 'iframes', 'walking')
+
     def __init__(self, game, pos, size, health, damage, i_window=30):
         super().__init__(game, 'enemy', pos, size)
 
@@ -91,9 +126,17 @@ class Enemy(PhysicsEntity):
         self.walking = 0 # Frame timer to track when they should be walking in one direction
 
     def update(self, tilemap, movement=(0, 0)):
+        super().update(tilemap, movement=self.plan_movement(tilemap, movement))
+        if abs(self.game.player.dashing) >= 50 and self.rect().colliderect(self.game.player.rect()): # Scenes find dash hits through their broadphase instead
+            return self.dash_hit()
+
+    def plan_movement(self, tilemap, movement=(0, 0)):
+        '''
+        Walking/shooting AI, run before the physics step. Returns the movement to step with
+        '''
         if self.walking:
             if tilemap.solid_check((self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)): # Using magic numbers relative to graphic images
-                if (self.collisions['left'] or self.collisions['right']): # Change direction at wall collision
+                if self.collisions & (LEFT | RIGHT): # Change direction at wall collision
                     self.flip = not self.flip
                 else:
                     movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
@@ -105,49 +148,56 @@ class Enemy(PhysicsEntity):
                 if (abs(dis[1]) < 16):
                     if (self.flip and dis[0] < 0): # Enemy must be facing player
                         self.game.sfx['shoot'].play()
-                        self.game.state.projectiles.append(EnemyProjectile(self.game, [self.rect().centerx - 7, self.rect().centery], -1.5, 0, self.damage))
-                        for i in range(4):
-                            self.game.state.sparks.append(Spark(self.game.state.projectiles[-1].pos, random.random() - 0.5 + math.pi, 2 + random.random()))
+                        projectile = self.game.state.spawn_projectile(EnemyProjectile, self.game, [self.rect().centerx - 7, self.rect().centery], -1.5, 0, self.damage)
+                        for i in range(self.game.governor.count(4)):
+                            self.game.state.sparks.spawn(projectile.pos, random.random() - 0.5 + math.pi, 2 + random.random())
                     if (not self.flip and dis[0] > 0):
                         self.game.sfx['shoot'].play()
-                        self.game.state.projectiles.append(EnemyProjectile(self.game, [self.rect().centerx + 7, self.rect().centery], 1.5, 0, self.damage))
-                        for i in range(4):
-                            self.game.state.sparks.append(Spark(self.game.state.projectiles[-1].pos, random.random() - 0.5, 2 + random.random()))
+                        projectile = self.game.state.spawn_projectile(EnemyProjectile, self.game, [self.rect().centerx + 7, self.rect().centery], 1.5, 0, self.damage)
+                        for i in range(self.game.governor.count(4)):
+                            self.game.state.sparks.spawn(projectile.pos, random.random() - 0.5, 2 + random.random())
         elif random.random() < 0.01: # Start walking on a semi-random cadence if not already walking
             self.walking = random.randint(30, 120)
+        return movement
 
-        super().update(tilemap, movement=movement)
+    def after_physics(self, movement):
+        super().after_physics(movement)
 
         if movement[0] != 0:
             self.set_action('run')
         else:
             self.set_action('idle')
 
-        # Process any dash attack received
+        # Count down immunity from the last hit
         self.iframes = max(0, self.iframes - 1)
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()) and self.iframes == 0: # If enemy collides with rect of dashing player and isn't immune
-                self.game.screenshake = max(16, self.game.screenshake)
-                self.game.sfx['hit'].play()
-                alive = self.take_damage(self.game.player.damage)
-                if alive:
-                    print(f'ENEMY HIT!\nDamage taken: {self.game.player.damage}\nRemaining health: {self.health}')
-                    self.iframes += self.i_window
-                    for i in range(30):
-                        angle = random.random() * math.pi * 2
-                        speed = random.random() * 5
-                        self.game.state.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                        self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-                else:
-                    for i in range(30):
-                        angle = random.random() * math.pi * 2
-                        speed = random.random() * 5
-                        self.game.state.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                        self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-                    print('ENEMY KILLED!')
-                    self.game.state.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                    self.game.state.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-                    return True
+
+    def dash_hit(self):
+        '''
+        Take a hit from the dashing player, unless immune. Returns True if it killed this enemy
+        '''
+        if self.iframes: # Still immune from the last hit
+            return False
+        self.game.screenshake = max(16, self.game.screenshake)
+        self.game.sfx['hit'].play()
+        alive = self.take_damage(self.game.player.damage)
+        if alive:
+            print(f'ENEMY HIT!\nDamage taken: {self.game.player.damage}\nRemaining health: {self.health}')
+            self.iframes += self.i_window
+            for i in range(self.game.governor.count(30)):
+                angle = random.random() * math.pi * 2
+                speed = random.random() * 5
+                self.game.state.sparks.spawn(self.rect().center, angle, 2 + random.random())
+                self.game.state.particles.spawn('particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
+        else:
+            for i in range(self.game.governor.count(30)):
+                angle = random.random() * math.pi * 2
+                speed = random.random() * 5
+                self.game.state.sparks.spawn(self.rect().center, angle, 2 + random.random())
+                self.game.state.particles.spawn('particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
+            print('ENEMY KILLED!')
+            self.game.state.sparks.spawn(self.rect().center, 0, 5 + random.random())
+            self.game.state.sparks.spawn(self.rect().center, math.pi, 5 + random.random())
+            return True
 
     def take_damage(self, damage):
         self.health -= damage
@@ -157,12 +207,19 @@ class Enemy(PhysicsEntity):
         super().render(surf, offset=offset)
 
         if self.flip:
-            surf.blit(pygame.transform.flip(self.game.assets['gun'], True, False), (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]))
+            img = self.game.assets['gun/flipped']
+            pos = (self.rect().centerx - 4 - img.get_width() - offset[0], self.rect().centery - offset[1])
         else:
-            surf.blit(self.game.assets['gun'], (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]))
+            img = self.game.assets['gun']
+            pos = (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1])
+        surf.blit(img, pos)
+        self.game.outlines.draw(img, pos)
 
 class Player(PhysicsEntity):
     # Handles the animation logic for the Player physics entity (and probably other stuff)
+    __slots__ = ('max_health', 'health', 'damage', 'i_window', 'iframes', 'dashing', 'kills', 'shuriken_charge', 'air_time', 'jumps', 'wall_slide',
+        'shuriken_ui_pos_x', 'shuriken_ui_pos_y', 'shuriken_ui_size_x', 'shuriken_ui_size_y', 'shuriken_ui_rect', 'radius', 'shuriken_widget')
+
     def __init__(self, game, pos, size, health=1, damage=10, i_window=30):
         super().__init__(game, 'player', pos, size)
         
@@ -190,6 +247,7 @@ class Player(PhysicsEntity):
         self.shuriken_ui_size_y = (self.game.screen.get_height() * 0.99) - self.shuriken_ui_pos_y
         self.shuriken_ui_rect = pygame.Rect(self.shuriken_ui_pos_x, self.shuriken_ui_pos_y, self.shuriken_ui_size_x, self.shuriken_ui_size_y)
         self.radius = self.shuriken_ui_size_x // 2 - 10
+        self.shuriken_widget = ShurikenWidget(self.shuriken_ui_rect.topleft, self.shuriken_ui_rect.size, self.game.assets['shuriken'], self.radius)
 
     def update(self, tilemap, movement=(0, 0)):
         super().update(tilemap, movement=movement)
@@ -204,17 +262,17 @@ class Player(PhysicsEntity):
             self.game.state.dead = 1
             self.game.screenshake = max(16, self.game.screenshake)
 
-        if self.collisions['down']:
+        if self.collisions & DOWN:
             self.air_time = 0
             self.jumps = 1
 
         # Track and handle logic for wall slide
         self.wall_slide = False
-        if (self.collisions['left'] or self.collisions['right']) and self.air_time > 4:
+        if self.collisions & (LEFT | RIGHT) and self.air_time > 4:
             self.wall_slide = True
             self.velocity[1] = min(self.velocity[1], 0.5) # Cap wall sliding velocity
             self.air_time = 5 # Freeze and reset air_time to prevent permanent fall death on long slide
-            if self.collisions['right']:
+            if self.collisions & RIGHT:
                 self.flip = False
             else:
                 self.flip = True
@@ -232,11 +290,11 @@ class Player(PhysicsEntity):
         # Handle dashing
         # Generate a random burst particle with random directions when triggered
         if abs(self.dashing) in {60, 50}:
-            for i in range(20):
+            for i in range(self.game.governor.count(20)):
                 angle = random.random() * math.pi * 2
                 speed = random.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed] # Particle velocity
-                self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame = random.randint(0, 7)))
+                self.game.state.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7))
         if self.dashing > 0:
             self.dashing = max(self.dashing - 1, 0)
         if self.dashing < 0:
@@ -247,7 +305,7 @@ class Player(PhysicsEntity):
                 self.velocity[0] *= 0.1
                 # Generate a stream of particles behind player during dash
                 pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-                self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame = random.randint(0, 7)))
+                self.game.state.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7))
 
         # Stop player from moving on x-axis permanently
         if self.velocity[0] > 0:
@@ -260,46 +318,8 @@ class Player(PhysicsEntity):
         if abs(self.dashing) <= 50:
             super().render(surf, offset=offset)
 
-        # Update Shuriken graphic
-        # Draw box
-        pygame.draw.rect(self.game.ui_display, (0, 0, 0), self.shuriken_ui_rect) # Box
-        pygame.draw.rect(self.game.ui_display, (100, 100, 100), self.shuriken_ui_rect, 2) # Outline
-        
-        # Add icon
-        icon = self.game.assets['shuriken'].copy()
-        icon_pos_x = self.shuriken_ui_pos_x + (self.shuriken_ui_size_x // 2) - icon.get_width() // 2
-        icon_pos_y = self.shuriken_ui_pos_y + (self.shuriken_ui_size_y // 2) - icon.get_height() // 2
-        self.game.ui_display.blit(icon, (icon_pos_x, icon_pos_y))
-
-        # Calculate fill circle and apply
-        fill_ratio = min(self.kills / self.shuriken_charge, 1)
-        if fill_ratio > 0:
-            # Create surface w/ alpha for the circle
-            fill_circle = pygame.Surface((self.shuriken_ui_size_x, self.shuriken_ui_size_y), pygame.SRCALPHA)
-
-            # Calculate angle for filled ratio
-            fill_angle = fill_ratio * 360
-
-            # Draw filled segment
-            center = (self.shuriken_ui_size_x // 2, self.shuriken_ui_size_y // 2)
-
-            if fill_ratio >= 1.0:
-                # Draw full circle
-                pygame.draw.circle(fill_circle, (255, 255, 255, 100), center, self.radius)
-            else:
-                points = [center]
-                num_points = max(int(fill_angle / 5), 2)
-
-                for i in range(num_points + 1):
-                    angle = math.radians(-90 + (i * fill_angle / num_points))
-                    x = center[0] + self.radius * math.cos(angle)
-                    y = center[1] + self.radius * math.sin(angle)
-                    points.append((x, y))
-                
-                if len(points) > 2:
-                    pygame.draw.polygon(fill_circle, (255, 255, 255, 100), points)
-
-            self.game.ui_display.blit(fill_circle, (self.shuriken_ui_pos_x, self.shuriken_ui_pos_y))
+        # Shuriken graphic. Only redrawn when the charge changes
+        self.game.ui.show(self.shuriken_widget, min(self.kills / self.shuriken_charge, 1))
 
     def jump(self):
         if self.wall_slide:
@@ -333,13 +353,14 @@ class Player(PhysicsEntity):
         if self.kills >= self.shuriken_charge:
             self.kills = 0 # Reset for next charge
             flipped = 1 if self.flip else -1
-            self.game.state.projectiles.append(PlayerShuriken(
+            self.game.state.spawn_projectile(
+                PlayerShuriken,
                 self.game, 
                 [self.rect().centerx - 7 * flipped, self.rect().centery], 
                 -3 * flipped, 
                 0, 
                 self.damage * 2
-            ))
+            )
             self.game.sfx['special_attack'].play()
 
     def take_damage(self, damage):
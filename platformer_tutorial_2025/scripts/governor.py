@@ -0,0 +1,59 @@
+from collections import deque
+
+FRAME_BUDGET_MS = 1000 / 60 # Work time per rendered frame the governor tries to stay under
+QUALITY_SCALES = [0.25, 0.5, 0.75, 1] # Effect amount per quality level, lowest first
+GOVERNOR_WINDOW = 30 # Frames averaged before deciding on a change
+DOWNGRADE_AT = 1.0 # Drop a level when the average frame takes more than this share of the budget
+UPGRADE_AT = 0.6 # Raise a level when it takes less than this share. The gap between the two keeps levels from flip-flopping
+GOVERNOR_COOLDOWN = 120 # Frames to wait after a change before judging again, so the new level gets a fair measurement
+
+class EffectsGovernor:
+    '''
+    Scales effects (sparks, particles, leaves, clouds) up and down to keep frame times within the budget.
+
+    Feed it the work time of each frame with record(). Emitters then ask count() how many effects to make, or multiply
+    spawn rates by scale. At the top quality level every count is unchanged.
+    '''
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, window=GOVERNOR_WINDOW):
+        self.budget_ms = budget_ms
+        self.frame_times = deque(maxlen=window)
+        self.quality = len(QUALITY_SCALES) - 1
+        self.scale = QUALITY_SCALES[self.quality]
+        self.cooldown = 0
+        self.downgrades = 0
+        self.upgrades = 0
+
+    def average_ms(self):
+        if not self.frame_times:
+            return 0
+        return sum(self.frame_times) / len(self.frame_times)
+
+    def set_quality(self, quality):
+        self.quality = max(0, min(len(QUALITY_SCALES) - 1, quality))
+        self.scale = QUALITY_SCALES[self.quality]
+        self.frame_times.clear() # Times from the old level say nothing about the new one
+        self.cooldown = GOVERNOR_COOLDOWN
+
+    def record(self, frame_ms):
+        self.frame_times.append(frame_ms)
+        if self.cooldown:
+            self.cooldown -= 1
+            return
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return
+        average = self.average_ms()
+        if average > self.budget_ms * DOWNGRADE_AT and self.quality > 0:
+            self.set_quality(self.quality - 1)
+            self.downgrades += 1
+        elif average < self.budget_ms * UPGRADE_AT and self.quality < len(QUALITY_SCALES) - 1:
+            self.set_quality(self.quality + 1)
+            self.upgrades += 1
+
+    def count(self, amount):
+        # How many of amount effects to actually make. Never scales a non-zero amount down to nothing
+        if not amount:
+            return 0
+        return max(1, int(amount * self.scale))
+
+    def stats(self):
+        return {'quality': self.quality, 'scale': self.scale, 'average_ms': round(self.average_ms(), 2), 'budget_ms': round(self.budget_ms, 2), 'downgrades': self.downgrades, 'upgrades': self.upgrades}
\ No newline at end of file
@@ -0,0 +1,65 @@
+import json
+import os
+import random
+import pygame
+
+KEY_NAMES = ['left', 'right', 'up', 'x', 'c'] # Keys the game reacts to, by pygame key name
+
+def use_dummy_drivers():
+    # Must run before pygame.init(). Window and audio device calls still work, they just don't go anywhere
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+class SilentSound:
+    '''
+    Stand-in for pygame.mixer.Sound that plays nothing. Headless runs don't need real sound files or an audio device
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.volume = 1.0
+
+    def play(self, loops=0):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+class ScriptedInput:
+    '''
+    Replays key presses as pygame events, frame by frame.
+
+    A script is a list of [frame, key name, 'down' or 'up'] entries, e.g. [[0, 'right', 'down'], [30, 'up', 'down']].
+    '''
+    def __init__(self, script):
+        self.frames = {} # Frame -> list of events for that frame
+        for frame, key, state in script:
+            event_type = pygame.KEYDOWN if state == 'down' else pygame.KEYUP
+            self.frames.setdefault(frame, []).append(pygame.event.Event(event_type, key=pygame.key.key_code(key)))
+
+    @classmethod
+    def from_file(cls, path):
+        f = open(path, 'r')
+        script = json.load(f)
+        f.close()
+        return cls(script)
+
+    @classmethod
+    def random(cls, frames, seed=None, press_chance=0.05):
+        '''
+        Mash random keys for the given number of frames. Useful for soak testing
+        '''
+        rng = random.Random(seed)
+        held = set()
+        script = []
+        for frame in range(frames):
+            for key in KEY_NAMES:
+                if rng.random() < press_chance:
+                    script.append([frame, key, 'up' if key in held else 'down'])
+                    held ^= {key}
+        return cls(script)
+
+    def events(self, frame):
+        return self.frames.get(frame, [])
\ No newline at end of file
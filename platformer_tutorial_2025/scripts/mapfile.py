@@ -0,0 +1,125 @@
+'''
+Compact binary map format, as an alternative to the JSON maps
+
+Layout (all little-endian):
+    header          - magic, format version, tile size, chunk shift, and counts for each section below
+    string table    - tile type names. A type's id is its index + 1 (0 is reserved for empty cells)
+    chunk directory - chunk x/y and the file offset of that chunk's cell data
+    offgrid records - type id, variant and pixel position of each offgrid tile
+    chunk data      - per chunk, the packed type id array followed by the packed variant array
+
+The file is memory-mapped so chunks can be decoded one at a time, only when asked for.
+'''
+
+from array import array
+import mmap
+import struct
+import sys
+from scripts.chunk import CHUNK_CELLS, CHUNK_SHIFT, Chunk, EMPTY
+
+MAGIC = b'NMAP'
+FORMAT_VERSION = 1
+MAP_EXTENSION = '.map'
+
+HEADER = struct.Struct('<4sHHBxHII') # magic, version, tile_size, chunk_shift, type count, chunk count, offgrid count
+TYPE_NAME = struct.Struct('<H') # Length of the utf-8 name that follows
+CHUNK_ENTRY = struct.Struct('<iiI') # cx, cy, offset of cell data
+OFFGRID_RECORD = struct.Struct('<HHdd') # type id, variant, x, y
+CELL_ARRAY_BYTES = 2 * CHUNK_CELLS # Arrays are unsigned 16 bit
+
+def _pack_cells(cells):
+    if sys.byteorder == 'big': # Arrays are stored in machine order, files are always little-endian
+        cells = array('H', cells)
+        cells.byteswap()
+    return cells.tobytes()
+
+def _unpack_cells(data):
+    cells = array('H')
+    cells.frombytes(data)
+    if sys.byteorder == 'big':
+        cells.byteswap()
+    return cells
+
+def write_map(path, tile_size, tile_types, chunks, offgrid_tiles):
+    '''
+    Write a map to path.
+
+    tile_types is the type table (index = type id, index 0 unused), chunks is an iterable of Chunks using those ids
+    and offgrid_tiles is a list of offgrid tile dicts.
+    '''
+    chunks = [chunk for chunk in chunks if chunk.count]
+    tile_types = list(tile_types)
+    for tile in offgrid_tiles: # Offgrid tiles can use types that never appear on the grid
+        if tile['type'] not in tile_types:
+            tile_types.append(tile['type'])
+    type_ids = {tile_type: type_id for type_id, tile_type in enumerate(tile_types) if type_id != EMPTY}
+
+    names = b''.join(TYPE_NAME.pack(len(name)) + name for name in [tile_type.encode('utf-8') for tile_type in tile_types[1:]])
+    data_start = HEADER.size + len(names) + CHUNK_ENTRY.size * len(chunks) + OFFGRID_RECORD.size * len(offgrid_tiles)
+
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, tile_size, CHUNK_SHIFT, len(tile_types) - 1, len(chunks), len(offgrid_tiles)))
+    f.write(names)
+    for i, chunk in enumerate(chunks):
+        f.write(CHUNK_ENTRY.pack(chunk.cx, chunk.cy, data_start + i * CELL_ARRAY_BYTES * 2))
+    for tile in offgrid_tiles:
+        f.write(OFFGRID_RECORD.pack(type_ids[tile['type']], tile['variant'], tile['pos'][0], tile['pos'][1]))
+    for chunk in chunks:
+        f.write(_pack_cells(chunk.types))
+        f.write(_pack_cells(chunk.variants))
+    f.close()
+
+class MapFile:
+    '''
+    Read-only, memory-mapped view of a binary map. Chunks are only decoded when read_chunk() is called
+    '''
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close() # The map stays valid after the file is closed
+
+        magic, version, self.tile_size, chunk_shift, type_count, chunk_count, offgrid_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a binary map file')
+        if version != FORMAT_VERSION or chunk_shift != CHUNK_SHIFT:
+            self.close()
+            raise ValueError(f'{path} uses map format version {version} (chunk shift {chunk_shift}), expected version {FORMAT_VERSION} (chunk shift {CHUNK_SHIFT})')
+
+        # String table
+        offset = HEADER.size
+        self.tile_types = [None]
+        for i in range(type_count):
+            length = TYPE_NAME.unpack_from(self.data, offset)[0]
+            offset += TYPE_NAME.size
+            self.tile_types.append(self.data[offset:offset + length].decode('utf-8'))
+            offset += length
+
+        # Chunk directory
+        self.chunk_offsets = {}
+        for i in range(chunk_count):
+            cx, cy, data_offset = CHUNK_ENTRY.unpack_from(self.data, offset)
+            self.chunk_offsets[(cx, cy)] = data_offset
+            offset += CHUNK_ENTRY.size
+
+        self.offgrid_offset = offset
+        self.offgrid_count = offgrid_count
+
+    def offgrid_tiles(self):
+        tiles = []
+        for type_id, variant, x, y in OFFGRID_RECORD.iter_unpack(self.data[self.offgrid_offset:self.offgrid_offset + OFFGRID_RECORD.size * self.offgrid_count]):
+            tiles.append({'type': self.tile_types[type_id], 'variant': variant, 'pos': [x, y]})
+        return tiles
+
+    def read_chunk(self, cx, cy):
+        # Decode a single chunk, or None if the map has nothing there. Type ids are the file's ids (see tile_types)
+        offset = self.chunk_offsets.get((cx, cy))
+        if offset is None:
+            return None
+        types = _unpack_cells(self.data[offset:offset + CELL_ARRAY_BYTES])
+        variants = _unpack_cells(self.data[offset + CELL_ARRAY_BYTES:offset + CELL_ARRAY_BYTES * 2])
+        return Chunk(cx, cy, types, variants)
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,76 @@
+import pygame
+import weakref
+
+OUTLINE_COLOR = (0, 0, 0, 180)
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+def outline_surface(img):
+    '''
+    The outline of an image: its silhouette blitted once per offset, on a surface 1 pixel bigger on every side
+    '''
+    sillhouette = pygame.mask.from_surface(img).to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+    surf = pygame.Surface((img.get_width() + 2, img.get_height() + 2), pygame.SRCALPHA)
+    for offset in OUTLINE_OFFSETS:
+        surf.blit(sillhouette, (1 + offset[0], 1 + offset[1]))
+    return surf
+
+def mask_outline(source, target):
+    # The full screen pass: outline everything drawn to source at once
+    display_mask = pygame.mask.from_surface(source)
+    display_sillhouette = display_mask.to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+    for offset in OUTLINE_OFFSETS:
+        target.blit(display_sillhouette, offset)
+
+class Outlines:
+    '''
+    Draws outlines of sprites onto a target surface (under the display), as the sprites are drawn.
+
+    Each image's outline is built the first time it's drawn and kept for as long as the image is, so steady state
+    drawing is just a blit per sprite. Batches of sprites that crowd together (particles, sparks) are outlined as one
+    shape instead, like the mask pass does: their silhouettes are merged on a scratch surface, which is then blitted
+    once per offset, so overlapping sprites get a single halo. When disabled, draw calls do nothing and the outline is
+    left to the full screen mask pass (mask_outline) instead.
+    '''
+    def __init__(self, target, enabled=True):
+        self.target = target
+        self.enabled = enabled
+        self.cache = weakref.WeakKeyDictionary() # Image -> outline, built on first use
+        self.silhouettes = weakref.WeakKeyDictionary() # Image -> its mask in OUTLINE_COLOR, built on first use
+        self.scratch = None # Where batches merge their silhouettes, the size of target. Made on first use
+
+    def get(self, img):
+        if img not in self.cache:
+            self.cache[img] = outline_surface(img)
+        return self.cache[img]
+
+    def draw(self, img, pos):
+        # pos is where img itself was drawn. Truncated first, like blit does
+        if self.enabled:
+            self.target.blit(self.get(img), (int(pos[0]) - 1, int(pos[1]) - 1))
+
+    def silhouette(self, img):
+        if img not in self.silhouettes:
+            self.silhouettes[img] = pygame.mask.from_surface(img).to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+        return self.silhouettes[img]
+
+    def batch_surface(self):
+        # The scratch surface to draw a batch's silhouettes on (in OUTLINE_COLOR, without blending), before outline_batch()
+        if self.scratch is None or self.scratch.get_size() != self.target.get_size():
+            self.scratch = pygame.Surface(self.target.get_size(), pygame.SRCALPHA)
+        return self.scratch
+
+    def outline_batch(self, rects):
+        # Outline what was drawn on the batch surface within rects, then wipe it for the next batch
+        if not rects:
+            return
+        area = rects[0].unionall(rects[1:]).clip(self.scratch.get_rect())
+        for offset in OUTLINE_OFFSETS:
+            self.target.blit(self.scratch, (area.x + offset[0], area.y + offset[1]), area)
+        self.scratch.fill((0, 0, 0, 0), area)
+
+    def draws(self, blit_sequence):
+        # Outline every (img, pos) of a Surface.blits sequence as a single batch
+        if self.enabled:
+            scratch = self.batch_surface()
+            rects = scratch.blits([(self.silhouette(img), pos, None, pygame.BLEND_RGBA_MAX) for img, pos in blit_sequence]) # Max keeps overlaps at OUTLINE_COLOR
+            self.outline_batch(rects)
\ No newline at end of file
@@ -1,6 +1,11 @@
+import numpy as np
 import pygame
 
+PARTICLE_CAPACITY = 32768 # Live particles a ParticleSystem can hold. Spawns past this are dropped
+
 class Particle:
+    __slots__ = ('game', 'type', 'pos', 'velocity', 'animation')
+
     def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0):
         self.game = game
         self.type = p_type
@@ -23,4 +28,114 @@ class Particle:
     
     def render(self, surf, offset=(0, 0)):
         img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
\ No newline at end of file
+        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
+
+class ParticleSystem:
+    '''
+    Every particle of a scene in preallocated NumPy arrays (position, velocity, animation frame and type).
+
+    Particle types are the 'particle/<type>' Animations in game.assets. update() moves and animates all particles
+    at once, and dead particles are removed by moving live ones from the end into their slots, so the live ones
+    always fill the first count entries. render() draws them all with a single Surface.blits call, alpha of the way
+    from their positions at the last snapshot() to the current ones.
+    '''
+    def __init__(self, game, capacity=PARTICLE_CAPACITY, wobble=None):
+        self.game = game
+        self.capacity = capacity
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.previous = np.zeros((capacity, 2)) # Positions at the last snapshot(), to interpolate rendering from
+        self.velocity = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.type = np.zeros(capacity, dtype=np.int32) # Index into self.types
+        self.done = np.zeros(capacity, dtype=bool)
+        self.wobble = wobble or {} # Type -> (rate, amplitude) of a sideways sine wobble driven by the animation frame
+
+        # Per type animation settings, indexed by type id
+        self.types = []
+        self.type_ids = {}
+        self.img_duration = []
+        self.length = [] # Animation length in frames
+        self.loop = []
+        self.first_image = [] # Index of the type's first image in self.images
+        self.images = [] # Every type's images, back to back
+        self.half_sizes = [] # (width // 2, height // 2) per image, to center particles on their position
+        for name, asset in game.assets.items():
+            if name.startswith('particle/'):
+                self.type_ids[name[9:]] = len(self.types)
+                self.types.append(name[9:])
+                self.img_duration.append(asset.img_duration)
+                self.length.append(asset.img_duration * len(asset.images))
+                self.loop.append(asset.loop)
+                self.first_image.append(len(self.images))
+                self.images += asset.images
+                self.half_sizes += [(img.get_width() // 2, img.get_height() // 2) for img in asset.images]
+        self.img_duration = np.array(self.img_duration, dtype=np.int32)
+        self.length = np.array(self.length, dtype=np.int32)
+        self.loop = np.array(self.loop, dtype=bool)
+        self.first_image = np.array(self.first_image, dtype=np.int32)
+        self.half_sizes = np.array(self.half_sizes, dtype=float).reshape(-1, 2)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.pos[i] = pos
+        self.previous[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = self.type_ids[p_type]
+        self.done[i] = False
+        self.count += 1
+
+    def snapshot(self):
+        # Call before a simulation step
+        self.previous[:self.count] = self.pos[:self.count]
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        kill = self.done[:n].copy() # Particles are removed on the update after their animation finished
+
+        self.pos[:n] += self.velocity[:n]
+
+        types = self.type[:n]
+        length = self.length[types]
+        frame = self.frame[:n] + 1
+        looped = self.loop[types]
+        self.frame[:n] = np.where(looped, frame % length, np.minimum(frame, length - 1)) # Loop, or stop at the last frame
+        self.done[:n] = ~looped & (self.frame[:n] >= length - 1)
+
+        for name, (rate, amplitude) in self.wobble.items():
+            wobbling = types == self.type_ids[name]
+            self.pos[:n, 0] += np.where(wobbling, np.sin(self.frame[:n] * rate) * amplitude, 0)
+
+        # Fill the holes left by dead particles with live ones from the end
+        dead = np.flatnonzero(kill)
+        if len(dead):
+            live_count = n - len(dead)
+            holes = dead[dead < live_count]
+            movers = np.flatnonzero(~kill[live_count:]) + live_count
+            for array in (self.pos, self.previous, self.velocity, self.frame, self.type, self.done):
+                array[holes] = array[movers]
+            self.count = live_count
+
+    def render(self, surf, offset=(0, 0), outlines=None, alpha=1):
+        n = self.count
+        if not n:
+            return
+        image_ids = self.first_image[self.type[:n]] + self.frame[:n] // self.img_duration[self.type[:n]]
+        pos = self.pos[:n] if alpha == 1 else self.previous[:n] + (self.pos[:n] - self.previous[:n]) * alpha
+        corners = pos - offset - self.half_sizes[image_ids]
+        images = self.images
+        sequence = [(images[image_id], corner) for image_id, corner in zip(image_ids.tolist(), corners.tolist())]
+        surf.blits(sequence, doreturn=False)
+        if outlines is not None:
+            outlines.draws(sequence)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import numpy as np
+
+UP, DOWN, LEFT, RIGHT = 1, 2, 4, 8 # Collision flag bits, e.g. entity.collisions & DOWN
+GRAVITY = 0.1
+MAX_FALL_SPEED = 5
+
+class PhysicsWorld:
+    '''
+    Struct-of-arrays physics for every PhysicsEntity in a scene.
+
+    Positions, velocities, sizes and collision flags live in NumPy arrays with one row per entity. An added entity's
+    pos/velocity become views of its row, so gameplay code reads and writes them like before while step() moves,
+    collides and applies gravity to a whole batch of entities in a handful of array operations. Each stepped
+    entity's collisions bitfield is updated after the step.
+    Rows of removed entities are reused, so views stay valid until the arrays have to grow.
+
+    Positions from before the latest step are kept too, so rendering can interpolate between steps (see interpolated()).
+    '''
+    def __init__(self, capacity=16):
+        self.capacity = 0
+        self.pos = np.zeros((0, 2))
+        self.previous = np.zeros((0, 2)) # Positions as of the last snapshot()
+        self.velocity = np.zeros((0, 2))
+        self.size = np.zeros((0, 2), dtype=np.int64)
+        self.collisions = np.zeros(0, dtype=np.uint8)
+        self.entities = [] # Slot -> entity, or None for free slots
+        self.free = [] # Free slots, lowest last
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def grow(self, capacity):
+        old = self.capacity
+        self.pos = np.concatenate((self.pos, np.zeros((capacity - old, 2))))
+        self.previous = np.concatenate((self.previous, np.zeros((capacity - old, 2))))
+        self.velocity = np.concatenate((self.velocity, np.zeros((capacity - old, 2))))
+        self.size = np.concatenate((self.size, np.zeros((capacity - old, 2), dtype=np.int64)))
+        self.collisions = np.concatenate((self.collisions, np.zeros(capacity - old, dtype=np.uint8)))
+        self.entities += [None] * (capacity - old)
+        self.free = list(range(capacity - 1, old - 1, -1)) + self.free
+        self.capacity = capacity
+        for slot, entity in enumerate(self.entities): # The old views point at the old arrays
+            if entity is not None:
+                self.bind(entity, slot)
+
+    def bind(self, entity, slot):
+        entity.world = self
+        entity.slot = slot
+        entity.pos = self.pos[slot]
+        entity.velocity = self.velocity[slot]
+
+    def add(self, entity):
+        if entity.world is self:
+            return
+        if entity.world is not None:
+            entity.world.remove(entity)
+        if not self.free:
+            self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        self.pos[slot] = entity.pos
+        self.previous[slot] = entity.pos
+        self.velocity[slot] = entity.velocity
+        self.size[slot] = entity.size
+        self.collisions[slot] = entity.collisions
+        self.entities[slot] = entity
+        self.bind(entity, slot)
+
+    def remove(self, entity):
+        # The entity keeps its state as plain lists again
+        slot = entity.slot
+        entity.pos = self.pos[slot].tolist()
+        entity.velocity = self.velocity[slot].tolist()
+        entity.world = None
+        entity.slot = None
+        self.entities[slot] = None
+        self.free.append(slot)
+
+    def clear(self):
+        for entity in self.entities:
+            if entity is not None:
+                self.remove(entity)
+
+    def snapshot(self):
+        # Call before a simulation step
+        self.previous[:] = self.pos
+
+    def interpolated(self, slot, alpha):
+        # Position alpha of the way from the last snapshot to now
+        return self.previous[slot] + (self.pos[slot] - self.previous[slot]) * alpha
+
+    def within(self, slots, center, radius):
+        # Bool array, True for the slots whose position is within radius of center
+        offsets = self.pos[np.asarray(slots, dtype=np.intp)] - center
+        return (offsets * offsets).sum(axis=1) <= radius * radius
+
+    def solid_extents(self, collision, left, top, size, tile_size):
+        '''
+        Find the physics tiles overlapping each entity rect.
+
+        Returns the lowest and highest overlapping tile column and row per entity. Entities without any overlap get a lowest
+        value above their highest one.
+        '''
+        first_x = left // tile_size
+        first_y = top // tile_size
+        last_x = (left + size[:, 0] - 1) // tile_size
+        last_y = (top + size[:, 1] - 1) // tile_size
+        min_x = np.full(len(left), np.iinfo(np.int64).max)
+        max_x = np.full(len(left), np.iinfo(np.int64).min)
+        min_y = min_x.copy()
+        max_y = max_x.copy()
+        # Entities only span a few tiles, so loop over those offsets and handle every entity at once for each
+        for dx in range(int((last_x - first_x).max()) + 1):
+            for dy in range(int((last_y - first_y).max()) + 1):
+                tile_x = first_x + dx
+                tile_y = first_y + dy
+                hit = (tile_x <= last_x) & (tile_y <= last_y)
+                hit[hit] = collision.solid_at(tile_x[hit], tile_y[hit])
+                min_x = np.where(hit, np.minimum(min_x, tile_x), min_x)
+                max_x = np.where(hit, np.maximum(max_x, tile_x), max_x)
+                min_y = np.where(hit, np.minimum(min_y, tile_y), min_y)
+                max_y = np.where(hit, np.maximum(max_y, tile_y), max_y)
+        return min_x, max_x, min_y, max_y
+
+    def step(self, tilemap, slots, movements):
+        '''
+        Move the entities in the given slots by their velocity plus movement, resolving tile collisions one axis at a time.
+
+        Matches the old per-entity update: a blocked entity is snapped against the tile it ran into (positions snap to
+        whole pixels on any contact), and gravity is applied after moving, zeroing vertical velocity on up/down contact.
+        '''
+        if not len(slots):
+            return
+        slots = np.asarray(slots, dtype=np.intp)
+        frame_movement = np.asarray(movements, dtype=float).reshape(len(slots), 2) + self.velocity[slots] # Every frame we add velocity
+        pos = self.pos[slots]
+        size = self.size[slots]
+        collision = tilemap.collision
+        tile_size = tilemap.tile_size
+
+        pos[:, 0] += frame_movement[:, 0]
+        left = np.trunc(pos[:, 0]).astype(np.int64) # Same truncation as building a pygame.Rect from the position
+        top = np.trunc(pos[:, 1]).astype(np.int64)
+        min_x, max_x, min_y, max_y = self.solid_extents(collision, left, top, size, tile_size)
+        hit = min_x <= max_x
+        right_hit = hit & (frame_movement[:, 0] > 0) # Movement to the right gets blocked, so snap left
+        left_hit = hit & (frame_movement[:, 0] < 0) # Movement to the left gets blocked, so snap right
+        left = np.where(right_hit, min_x * tile_size - size[:, 0], left)
+        left = np.where(left_hit, (max_x + 1) * tile_size, left)
+        pos[:, 0] = np.where(hit, left, pos[:, 0])
+
+        pos[:, 1] += frame_movement[:, 1]
+        left = np.trunc(pos[:, 0]).astype(np.int64)
+        top = np.trunc(pos[:, 1]).astype(np.int64)
+        min_x, max_x, min_y, max_y = self.solid_extents(collision, left, top, size, tile_size)
+        hit = min_x <= max_x
+        down_hit = hit & (frame_movement[:, 1] > 0) # Movement to the bottom gets blocked, so snap up
+        up_hit = hit & (frame_movement[:, 1] < 0) # Movement to the top gets blocked, so snap down
+        top = np.where(down_hit, min_y * tile_size - size[:, 1], top)
+        top = np.where(up_hit, (max_y + 1) * tile_size, top)
+        pos[:, 1] = np.where(hit, top, pos[:, 1])
+
+        # Apply gravity acceleration after the movement has been calculated, reset on up/down contact
+        fall = np.minimum(MAX_FALL_SPEED, self.velocity[slots, 1] + GRAVITY)
+        self.velocity[slots, 1] = np.where(up_hit | down_hit, 0, fall)
+        self.pos[slots] = pos
+        collisions = up_hit * UP | down_hit * DOWN | left_hit * LEFT | right_hit * RIGHT
+        self.collisions[slots] = collisions
+        for slot, flags in zip(slots.tolist(), collisions.tolist()):
+            self.entities[slot].collisions = flags
\ No newline at end of file
@@ -0,0 +1,39 @@
+POOL_SIZE = 32 # Objects made up front per pool
+POOL_MAX_SIZE = 256 # Released objects past this many are left for the garbage collector
+
+class ObjectPool:
+    '''
+    Recycles short-lived objects of one class instead of building new ones.
+
+    The class needs a reset() method taking the same arguments as __init__, which sets up every attribute in place.
+    acquire() resets a free object (a hit) or builds a new one when none are free (a miss). release() hands an object
+    back once nothing refers to it anymore.
+    '''
+    def __init__(self, cls, size=POOL_SIZE, max_size=POOL_MAX_SIZE):
+        self.cls = cls
+        self.max_size = max_size
+        self.free = [cls.__new__(cls) for i in range(size)] # Blank objects, acquire() resets them before use
+        self.in_use = 0
+        self.hits = 0
+        self.misses = 0
+        self.high_water = 0 # Most objects in use at once
+
+    def acquire(self, *args, **kwargs):
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args, **kwargs)
+            self.hits += 1
+        else:
+            obj = self.cls(*args, **kwargs)
+            self.misses += 1
+        self.in_use += 1
+        self.high_water = max(self.high_water, self.in_use)
+        return obj
+
+    def release(self, obj):
+        self.in_use -= 1
+        if len(self.free) < self.max_size:
+            self.free.append(obj)
+
+    def stats(self):
+        return {'in_use': self.in_use, 'free': len(self.free), 'hits': self.hits, 'misses': self.misses, 'high_water': self.high_water}
\ No newline at end of file
@@ -1,13 +1,39 @@
 import math
 import pygame
-from scripts.particle import Particle
-from scripts.spark import Spark
 import random
 
+ROTATION_STEPS = 72 # Pre-rendered angles per rotating sprite. 5 degrees apart, which is exactly the shuriken's spin rate
+
+class RotationCache:
+    '''
+    Every rotation of an image a rotating sprite needs, rendered once up front.
+
+    get() returns the pre-rendered angle nearest to the one asked for, along with where its top-left corner sits
+    relative to the sprite's center, so nothing is transformed or measured while drawing.
+    '''
+    def __init__(self, img, steps=ROTATION_STEPS):
+        self.step = 360 / steps
+        self.frames = [] # (rotated image, top-left offset from the center) per step
+        for i in range(steps):
+            rotated = pygame.transform.rotozoom(img, i * self.step, 1.0)
+            self.frames.append((rotated, (-(rotated.get_width() // 2), -(rotated.get_height() // 2))))
+
+    def get(self, angle):
+        return self.frames[round(angle / self.step) % len(self.frames)]
+
 class Projectile():
+    __slots__ = ('game', 'pos', 'previous', 'direction', 'timer', 'damage', 'img', 'hitbox')
+
     def __init__(self, game, pos, direction, timer, damage=0, img=None):
+        self.reset(game, pos, direction, timer, damage, img)
+
+    def reset(self, game, pos, direction, timer, damage=0, img=None):
+        '''
+        Set up every attribute in place, so pooled projectiles can be reused (see ObjectPool)
+        '''
         self.game = game
         self.pos = pos
+        self.previous = [pos[0], pos[1]] # Position at the last snapshot(), to interpolate rendering from
         self.direction = direction
         self.timer = timer
         self.damage = damage
@@ -15,28 +41,41 @@ class Projectile():
             self.img = img
         else:
             self.img = game.assets['projectile']
+        self.hitbox = self.img.get_rect() # Reused by rect()
 
     def rect(self):
-        return pygame.Rect(self.pos[0], self.pos[1], self.img.get_width(), self.img.get_height())
+        # The same Rect every call, moved to the current position. Copy it to keep it around
+        self.hitbox.x = self.pos[0]
+        self.hitbox.y = self.pos[1]
+        return self.hitbox
+
+    def snapshot(self):
+        # Call before a simulation step
+        self.previous[0] = self.pos[0]
+        self.previous[1] = self.pos[1]
+
+    def render_offset(self, offset, alpha):
+        # Camera offset that makes render() draw this projectile alpha of the way between its last two steps
+        return (offset[0] + (self.pos[0] - self.previous[0]) * (1 - alpha), offset[1] + (self.pos[1] - self.previous[1]) * (1 - alpha))
 
     def update(self, tilemap):
         self.pos[0] += self.direction
         self.timer += 1
 
     def render(self, surf, offset=(0, 0)):
-        surf.blit(self.img, 
-                  (self.pos[0] - self.img.get_width() / 2 - offset[0], 
-                   self.pos[1] - self.img.get_height() / 2 - offset[1])
-        )
+        pos = (self.pos[0] - self.img.get_width() / 2 - offset[0], 
+               self.pos[1] - self.img.get_height() / 2 - offset[1])
+        surf.blit(self.img, pos)
+        self.game.outlines.draw(self.img, pos)
 
     def _destroy_projectile(self, sparks=False):
         '''
         Destroys projectile and queues some Sparks if necessary
         '''
-        self.game.state.projectiles.remove(self)
+        self.game.state.kill_projectile(self)
         if sparks:
-            for i in range(4):
-                self.game.state.sparks.append(Spark(self.pos, random.random() - 0.5 + (math.pi if self.direction > 0 else 0), 2 + random.random()))
+            for i in range(self.game.governor.count(4)):
+                self.game.state.sparks.spawn(self.pos, random.random() - 0.5 + (math.pi if self.direction > 0 else 0), 2 + random.random())
 
 class EnemyProjectile(Projectile):
     """
@@ -45,8 +84,7 @@ class EnemyProjectile(Projectile):
     Unlike the base Projectile class, EnemyProjectile handles collision with the player,
     applies damage, and manages its own destruction upon hitting the player or a solid tile.
     """
-    def __init__(self, game, pos, direction, timer, damage=0, img=None):
-        super().__init__(game, pos, direction, timer, damage, img)
+    __slots__ = ()
 
     def update(self, tilemap):
         '''
@@ -59,15 +97,15 @@ class EnemyProjectile(Projectile):
         elif self.timer > 360: # Time out the projectile
             super()._destroy_projectile(sparks=False)
         elif abs(self.game.player.dashing) < 50 and self.game.player.iframes == 0:
-            if self.game.player.rect().collidepoint(self.pos):
-                self.game.state.projectiles.remove(self)
+            if self.game.state.broadphase.query_point('player', self.pos):
+                self.game.state.kill_projectile(self)
                 self.game.sfx['hit'].play()
                 alive = self.game.player.take_damage(self.damage)
-                for i in range(30):
+                for i in range(self.game.governor.count(30)):
                     angle = random.random() * math.pi * 2
                     speed = random.random() * 5
-                    self.game.state.sparks.append(Spark(self.game.player.rect().center, angle, 2 + random.random()))
-                    self.game.state.particles.append(Particle(self.game, 'particle', self.game.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                    self.game.state.sparks.spawn(self.game.player.rect().center, angle, 2 + random.random())
+                    self.game.state.particles.spawn('particle', self.game.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
                 if alive:
                     self.game.screenshake = max(8, self.game.screenshake)
                     print(f'PLAYER HIT!\nDamage Taken: {self.damage}\nHealth Remaining: {self.game.player.health}')
@@ -89,8 +127,10 @@ class PlayerShuriken(Projectile):
     
     Walls will still break the projectile.
     """
-    def __init__(self, game, pos, direction, timer, damage=0, img=None):
-        super().__init__(game, pos, direction, timer, damage, img=game.assets['shuriken'])
+    __slots__ = ('rotation_angle', 'rotation_rate')
+
+    def reset(self, game, pos, direction, timer, damage=0, img=None):
+        super().reset(game, pos, direction, timer, damage, img=game.assets['shuriken'])
 
         self.rotation_angle = 0 # Rotation of the img
         self.rotation_rate = 5 if self.direction < 1 else -5 # Rate of the rotation changing per frame
@@ -104,7 +144,7 @@ class PlayerShuriken(Projectile):
         # Rotate img for rendering
         self.rotation_angle += self.rotation_rate
 
-        enemy_hit = super().rect().collideobjectsall(self.game.state.enemies, key=lambda e: e.rect())
+        enemy_hit = self.game.state.broadphase.query('enemies', super().rect())
 
         if tilemap.solid_check(self.pos): # Remove on collision with physics tile
             super()._destroy_projectile(sparks=True)
@@ -117,25 +157,25 @@ class PlayerShuriken(Projectile):
             if alive:
                 print(f'ENEMY HIT!\nDamage taken: {self.damage}\nRemaining health: {enemy_hit.health}')
                 enemy_hit.iframes += enemy_hit.i_window
-                for i in range(30):
+                for i in range(self.game.governor.count(30)):
                     angle = random.random() * math.pi * 2
                     speed = random.random() * 5
-                    self.game.state.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                    self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                    self.game.state.sparks.spawn(self.rect().center, angle, 2 + random.random())
+                    self.game.state.particles.spawn('particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
             else:
-                for i in range(30):
+                for i in range(self.game.governor.count(30)):
                     angle = random.random() * math.pi * 2
                     speed = random.random() * 5
-                    self.game.state.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                    self.game.state.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                    self.game.state.sparks.spawn(self.rect().center, angle, 2 + random.random())
+                    self.game.state.particles.spawn('particle', self.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
                 print('ENEMY KILLED!')
-                self.game.state.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.state.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-                self.game.state.enemies.remove(enemy_hit)
+                self.game.state.sparks.spawn(self.rect().center, 0, 5 + random.random())
+                self.game.state.sparks.spawn(self.rect().center, math.pi, 5 + random.random())
+                self.game.state.remove_enemy(enemy_hit)
 
     def render(self, surf, offset=(0, 0)):
-        rotated_img = pygame.transform.rotozoom(self.img, self.rotation_angle, 1.0)
-        rotated_rect = rotated_img.get_rect(center=(self.pos[0] - offset[0],
-                                                    self.pos[1] - offset[1]))
-        surf.blit(rotated_img, rotated_rect)
+        rotated_img, corner = self.game.assets['shuriken/rotations'].get(self.rotation_angle)
+        pos = (int(self.pos[0] - offset[0]) + corner[0], int(self.pos[1] - offset[1]) + corner[1]) # Centered the way Rect(center=...) does it
+        surf.blit(rotated_img, pos)
+        self.game.outlines.draw(rotated_img, pos)
 
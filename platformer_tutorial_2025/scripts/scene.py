@@ -1,15 +1,67 @@
-import math
 import os
 import pygame
 import random
 from scripts.clouds import Cloud, Clouds
+from scripts.container import EntityList
 from scripts.entities import Enemy
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.mapfile import MAP_EXTENSION
+from scripts.particle import ParticleSystem
+from scripts.physics import PhysicsWorld
+from scripts.pool import ObjectPool
+from scripts.projectile import EnemyProjectile, PlayerShuriken
+from scripts.spark import SparkSystem
+from scripts.spatial import SpatialHash
 from scripts.tilemap import Tilemap
 from scripts.transitioner import Transitioner
 import sys
 
+MAP_PATH = 'data/maps/'
+MAP_FORMATS = [MAP_EXTENSION, '.json'] # Map file extensions, most preferred first
+LOD_ACTIVE_RADIUS = 320 # Enemies this close to the player (in pixels) get full AI, physics and animation every frame
+LOD_REST_RADIUS = 640 # Enemies this close only get physics (no AI or animation), caught up every LOD_REST_INTERVAL frames. Anything further is frozen
+LOD_REST_INTERVAL = 4 # Resting enemies run this many physics steps at once, every this many frames, so they fall as fast as at full rate
+BROADPHASE_CELL_SIZE = 32 # A couple of entity widths, so most entities sit in 1-2 cells
+
+class Broadphase:
+    '''
+    Spatial hashes of everything in a scene that can be hit, one per layer ('enemies', 'player', 'transitioners').
+
+    Overlap checks query a layer with a rect or point and only look at things in nearby cells. Layers of moving
+    things are refreshed every frame, static ones when the level loads.
+    '''
+    def __init__(self, cell_size=BROADPHASE_CELL_SIZE):
+        self.cell_size = cell_size
+        self.layers = {} # Layer name -> SpatialHash
+
+    def layer(self, name):
+        if name not in self.layers:
+            self.layers[name] = SpatialHash(self.cell_size)
+        return self.layers[name]
+
+    def clear(self):
+        for layer in self.layers.values():
+            layer.clear()
+
+    def rebuild(self, name, things):
+        # Replace a layer's contents with things (anything with a rect() method)
+        layer = self.layer(name)
+        layer.clear()
+        for thing in things:
+            layer.insert(thing, thing.rect().copy()) # Entities reuse their rect, the hash needs one that stays put
+
+    def insert(self, name, thing):
+        self.layer(name).insert(thing, thing.rect().copy())
+
+    def remove(self, name, thing):
+        self.layer(name).remove(thing)
+
+    def query(self, name, rect):
+        # Everything in the layer overlapping rect, in the order it was added
+        return self.layer(name).query(rect)
+
+    def query_point(self, name, pos):
+        return self.layer(name).query_point(pos)
+
 class Scene:
     '''
     Base class for game scenes
@@ -30,27 +82,56 @@ class GameplayScene(Scene):
     '''
     Scene specific to the main gameplay loop
     '''
-    def __init__(self, game, level):
+    def __init__(self, game, level, streaming=False):
         super().__init__(game)
         
         # Metadata
         self.level = level
         self.complete = False
+        self.streaming = streaming # Stream binary maps around the camera instead of loading them whole
+        self.map_dir = MAP_PATH # Where the level maps are read from
 
         # Map stuff
         self.cloud_count = 0 if self.level == 0 else 16
         self.clouds = Clouds(self.game.assets['clouds'], count=self.cloud_count)
         self.tilemap = Tilemap(self.game, tile_size=16)
+        self.physics = PhysicsWorld() # Batched physics state of the player and enemies
+        self.broadphase = Broadphase() # Overlap checks between the player, enemies, projectiles and transitioners
+        self.sparks = SparkSystem()
+        self.particles = ParticleSystem(self.game, wobble={'leaf': (0.035, 0.3)}) # Put a wobble on the leaf fall with a sin wave
+        self.pools = {cls: ObjectPool(cls) for cls in [EnemyProjectile, PlayerShuriken]} # Projectiles are recycled instead of rebuilt
+        self.enemies = EntityList()
+        self.projectiles = EntityList(on_remove=self.release_projectile) # Dead projectiles go back to their pool once compacted
+        self.transitioners = EntityList()
 
         # Level stuff
         self.movement = [False, False] # Used to track movement triggers by the player
 
+    def map_path(self, map_id):
+        '''
+        Path to the map file for a level. The binary map is used when there is one, otherwise the json one.
+        After editing a json map that has a binary copy, run convert_maps.py on it again to update the copy
+        '''
+        paths = [os.path.join(self.map_dir, str(map_id) + ext) for ext in MAP_FORMATS]
+        for path in paths:
+            if os.path.exists(path):
+                return path
+        return paths[-1]
+
+    def map_count(self):
+        # Levels can have more than one file (binary + json), so count unique level names
+        return len({os.path.splitext(name)[0] for name in os.listdir(self.map_dir)})
+
     def load_level(self, map_id):
         '''
         Reset the game on the given level (map_id)
         '''
         # Load map
-        self.tilemap.load('data/maps/' + str(map_id) + '.json')
+        map_path = self.map_path(map_id)
+        if self.streaming and map_path.endswith(MAP_EXTENSION): # Only binary maps can be streamed, json maps are always loaded whole
+            self.tilemap.stream(map_path)
+        else:
+            self.tilemap.load(map_path)
 
         # Handle leaf spawners
         self.leaf_spawners = []
@@ -58,27 +139,44 @@ class GameplayScene(Scene):
             self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13)) # Offset by 4 pixels for leaf falling. Numbers based on tree img size
 
         # Handle original Player/Enemy Spawners
-        self.enemies = []
+        self.physics.clear()
+        self.physics.add(self.game.player)
+        self.enemies.clear()
         for spawner in self.tilemap.extract([('spawners', 0), ('spawners', 1)]):
             if spawner['variant'] == 0: # Player variant
                 # Spawn player
-                self.game.player.pos = list(spawner['pos'])
+                self.game.player.pos[:] = spawner['pos'] # In place, the player's position lives in the physics arrays
                 self.game.player.air_time = 0 # Reset on respawn
                 
                 # Load transition location
                 self.transition_loc = pygame.Rect(spawner['pos'][0], spawner['pos'][1], 8, 15)
             else:
-                self.enemies.append(Enemy(self.game, spawner['pos'], (8, 15), 10, 10))
+                enemy = Enemy(self.game, spawner['pos'], (8, 15), 10, 10)
+                self.enemies.append(enemy)
+                self.physics.add(enemy)
         
         # Obtain Transitioners
-        self.transitioners = []
+        self.transitioners.clear()
         for tile in self.tilemap.extract([('transitioner', 0)]):
             self.transitioners.append(Transitioner(self.game, tile['pos'], (8, 15), self.level + 1))
+
+        # Transitioners don't move, so their layer is only built here
+        self.broadphase.clear()
+        self.broadphase.rebuild('transitioners', self.transitioners)
+        self.broadphase.rebuild('enemies', self.enemies) # From here on only enemies that moved get updated
+
+        # Pre-composite the remaining static tiles now that spawners/transitioners are pulled out, and merge collision geometry
+        # When streaming, only around where the camera starts (0, 0, see below). The rest is done as it streams in
+        area = None
+        if self.tilemap.streamer is not None:
+            area = self.tilemap.streamer.area((0, 0), self.game.display.get_size())
+        self.tilemap.bake(area)
+        self.tilemap.collision.build(area)
         
         # Reset other entity collections
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
+        self.projectiles.clear()
+        self.particles.clear()
+        self.sparks.clear()
 
         # Reset values
         self.game.player.health = self.game.player.max_health
@@ -86,39 +184,97 @@ class GameplayScene(Scene):
         self.complete = False # Are all enemies dead?
         self.transitioning = False # Did player reach a Transition point?
         self.transition = -30 # Transition speed when moving to a new level
+        self.frame = 0 # Simulation steps since the level loaded, schedules resting enemies
         self.game.scroll = [0, 0] # Offset which emulates a "camera" experience
+        self.game.prev_scroll = [0, 0] # Don't interpolate the camera across levels
+        self.physics.snapshot() # Spawning isn't movement, don't interpolate from the old spots
+
+    def remove_enemy(self, enemy):
+        self.enemies.kill(enemy)
+        self.physics.remove(enemy)
+        self.broadphase.remove('enemies', enemy)
+
+    def spawn_projectile(self, cls, *args):
+        # Takes the projectile class and its constructor arguments
+        projectile = self.pools[cls].acquire(*args)
+        self.projectiles.append(projectile)
+        return projectile
+
+    def kill_projectile(self, projectile):
+        self.projectiles.kill(projectile)
+
+    def release_projectile(self, projectile):
+        # Only once it's out of self.projectiles, or a recycled projectile could be marked dead
+        self.pools[type(projectile)].release(projectile)
 
     def update(self):
+        # Positions to interpolate rendering from
+        self.physics.snapshot()
+        self.sparks.snapshot()
+        self.particles.snapshot()
+        for projectile in self.projectiles:
+            projectile.snapshot()
+        self.frame += 1
+
         # Track load level animation
         if self.transition < 0: # For the start of a level
             self.transition += 1
         if self.complete and self.transitioning: # Track contact with transitioner
             self.transition += 1
         if self.transition > 30: # Trigger the new level load
-                self.level = min(self.level + 1, len(os.listdir('data/maps')) - 1)
+                self.level = min(self.level + 1, self.map_count() - 1)
                 self.load_level(self.level)
 
+        # Stream in map chunks around the camera
+        self.tilemap.update_streaming(self.game.scroll, self.game.display.get_size())
+
         # Background assets
         self.clouds.update()
 
         for rect in self.leaf_spawners:
-            if random.random() * 49999 < rect.width * rect.height: # Control spawn rate in relation to the size of the tree
+            if random.random() * 49999 < rect.width * rect.height * self.game.governor.scale: # Control spawn rate in relation to the size of the tree
                 pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                self.particles.append(Particle(self.game, 'leaf', pos, velocity=[-0.1, 0.3], frame=random.randint(0, 20)))
+                self.particles.spawn('leaf', pos, velocity=(-0.1, 0.3), frame=random.randint(0, 20))
 
         # Check for progression to next level
         if len(self.enemies) == 0: # All enemies defeated, unlock next room
             self.complete = True
-            if self.game.player.rect().collidelistall([x.rect() for x in self.transitioners]): # Start the countdown to new level
+            if self.broadphase.query('transitioners', self.game.player.rect()): # Start the countdown to new level
                 self.transitioning = True
 
 
-        # Handle enemies
-        for enemy in self.enemies.copy():
-            kill = enemy.update(self.tilemap, (0, 0))
-            if kill:
-                self.game.player.register_kill()
-                self.enemies.remove(enemy)
+        # Simulation level of detail. Enemies near the player are fully simulated, mid-range ones only settle under
+        # physics, a few frames' worth at a time (spread out by slot), far ones are frozen until the player comes back in range
+        slots = [enemy.slot for enemy in self.enemies]
+        center = self.game.player.rect().center
+        active = self.physics.within(slots, center, LOD_ACTIVE_RADIUS).tolist()
+        in_range = self.physics.within(slots, center, LOD_REST_RADIUS).tolist()
+        active_enemies = []
+        resting_enemies = []
+        for enemy, is_active, is_in_range in zip(self.enemies, active, in_range):
+            if is_active:
+                active_enemies.append(enemy)
+            elif is_in_range and (self.frame + enemy.slot) % LOD_REST_INTERVAL == 0:
+                resting_enemies.append(enemy)
+
+        # Handle enemies. AI first, then one physics step for all of them, then the per-enemy reactions
+        movements = [enemy.plan_movement(self.tilemap, (0, 0)) for enemy in active_enemies]
+        self.physics.step(self.tilemap, [enemy.slot for enemy in active_enemies], movements)
+        for enemy, movement in zip(active_enemies, movements):
+            enemy.after_physics(movement)
+        resting_slots = [enemy.slot for enemy in resting_enemies]
+        for i in range(LOD_REST_INTERVAL): # One step per frame since their last one. Single steps, so fast falls can't skip through thin floors
+            self.physics.step(self.tilemap, resting_slots, [(0, 0)] * len(resting_slots)) # No AI, no animation
+        for enemy in active_enemies + resting_enemies:
+            self.broadphase.insert('enemies', enemy)
+
+        # Dash attacks hit every (non-immune) enemy the dashing player overlaps
+        if abs(self.game.player.dashing) >= 50:
+            for enemy in self.broadphase.query('enemies', self.game.player.rect()):
+                kill = enemy.dash_hit()
+                if kill:
+                    self.game.player.register_kill()
+                    self.remove_enemy(enemy)
 
         # Check Player death
         if self.dead: # You died, start over in 40 frames
@@ -129,59 +285,53 @@ class GameplayScene(Scene):
                 self.load_level(self.level)
         else: # Update as usual and continue
             self.game.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+        self.broadphase.rebuild('player', [self.game.player])
 
         # Resolve sparks
-        for spark in self.sparks.copy():
-            kill = spark.update()
-            if kill:
-                self.sparks.remove(spark)
+        self.sparks.update()
         
         # Resolve Projectiles
-        for projectile in self.projectiles.copy():
+        for projectile in self.projectiles:
             projectile.update(self.tilemap)
 
         # Resolve Particles
-        for particle in self.particles.copy():
-            kill = particle.update()
-            if particle.type == 'leaf':
-                particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3 # Put a wobble on the leaf fall with a sin wave
-            if kill:
-                self.particles.remove(particle)
-
-    def render(self, offset=(0, 0)):
+        self.particles.update()
+
+        # Drop everything that died this frame
+        self.enemies.compact()
+        self.projectiles.compact()
+
+    def render(self, offset=(0, 0), alpha=1):
         # Background
-        self.clouds.render(self.game.display_2, offset=offset)
+        self.clouds.render(self.game.display_2, offset=offset, count=self.game.governor.count(self.cloud_count))
 
         # Tilemap
-        self.tilemap.render(self.game.display, offset=offset)
+        self.tilemap.render(self.game.display, offset=offset, outlines=self.game.outlines)
 
         # Special conditions
         if self.complete:
             for tile in self.transitioners:
-                self.game.display.blit(tile.img,
-                    (tile.pos[0] - offset[0],
-                    tile.pos[1] - offset[1])  
-                )
+                pos = (tile.pos[0] - offset[0], tile.pos[1] - offset[1])
+                self.game.display.blit(tile.img, pos)
+                self.game.outlines.draw(tile.img, pos)
 
         # Enemies
         for enemy in self.enemies:
-            enemy.render(self.game.display, offset=offset)
+            enemy.render(self.game.display, offset=enemy.render_offset(offset, alpha))
         
         # Player
         if not self.dead:
-            self.game.player.render(self.game.display, offset=offset)
+            self.game.player.render(self.game.display, offset=self.game.player.render_offset(offset, alpha))
 
         # Sparks
-        for spark in self.sparks:
-            spark.render(self.game.display, offset=offset)
+        self.sparks.render(self.game.display, offset=offset, outlines=self.game.outlines, alpha=alpha)
 
         # Projectiles
         for projectile in self.projectiles:
-            projectile.render(self.game.display, offset=offset)
+            projectile.render(self.game.display, offset=projectile.render_offset(offset, alpha))
 
         # Particles
-        for particle in self.particles:
-            particle.render(self.game.display, offset=offset)
+        self.particles.render(self.game.display, offset=offset, outlines=self.game.outlines, alpha=alpha)
     
 
 class PauseScene(Scene):
@@ -189,6 +339,7 @@ class PauseScene(Scene):
         super().__init__(game)
         self.pause_display = pygame.Surface((self.game.screen.get_width() // 4, self.game.screen.get_height() // 4)) # Set pause space
         self.is_paused = False
+        self.shown = False # Is the pause screen on the window already? Nothing changes while paused, so it's drawn once
 
     def update(self):
         pass # To be used for any updates later
@@ -201,12 +352,17 @@ class PauseScene(Scene):
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         self.pause()
+                if event.type == pygame.WINDOWEXPOSED: # The window lost what was on it, present all of it again
+                    self.game.mark_dirty(self.game.screen.get_rect())
 
     def render(self):
         # TODO: This is centered correctly, but I need a proper pause screen...
         pygame.draw.circle(self.pause_display, (255, 255, 255), (self.pause_display.get_width() // 2, self.pause_display.get_height() // 2), self.pause_display.get_width() // 3)
-        self.game.screen.blit(self.pause_display, (self.game.screen.get_width() // 2 - self.pause_display.get_width() // 2, self.game.screen.get_height() // 2 - self.pause_display.get_height() // 2))
+        self.game.mark_dirty(self.game.screen.blit(self.pause_display, (self.game.screen.get_width() // 2 - self.pause_display.get_width() // 2, self.game.screen.get_height() // 2 - self.pause_display.get_height() // 2)))
+        self.shown = True
 
     def pause(self):
         self.is_paused = not self.is_paused
+        if self.is_paused: # Needs drawing on the first paused frame. Unpausing redraws the whole screen anyway
+            self.shown = False
 
@@ -1,7 +1,13 @@
 import math
+import numpy as np
 import pygame
+from scripts.outline import OUTLINE_COLOR
+
+SPARK_CAPACITY = 8192 # Live sparks a SparkSystem can hold. Spawns past this are dropped
 
 class Spark:
+    __slots__ = ('pos', 'angle', 'speed')
+
     def __init__(self, pos, angle, speed):
         self.pos = list(pos)
         self.angle = angle
@@ -22,4 +28,74 @@ class Spark:
             (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0], self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[1]),
         ]
 
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
\ No newline at end of file
+        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+
+class SparkSystem:
+    '''
+    Every spark of a scene in preallocated NumPy arrays.
+
+    A spark's angle never changes, so its cos/sin are worked out once when it spawns. update() moves and slows all
+    sparks at once, and render() builds every spark's 4-point polygon in one pass before drawing them, alpha of the way
+    from the last snapshot() to now. Dead sparks are removed by moving live ones from the end into their slots.
+    '''
+    def __init__(self, capacity=SPARK_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.previous = np.zeros((capacity, 2)) # Positions at the last snapshot(), to interpolate rendering from
+        self.direction = np.zeros((capacity, 2)) # (cos, sin) of each spark's angle
+        self.speed = np.zeros(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, pos, angle, speed):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.pos[i] = pos
+        self.previous[i] = pos
+        self.direction[i] = (math.cos(angle), math.sin(angle))
+        self.speed[i] = speed
+        self.count += 1
+
+    def snapshot(self):
+        # Call before a simulation step
+        self.previous[:self.count] = self.pos[:self.count]
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        self.pos[:n] += self.direction[:n] * self.speed[:n, None]
+        self.speed[:n] = np.maximum(0, self.speed[:n] - 0.1)
+
+        # Sparks die once they stop. Fill their slots with live ones from the end
+        dead = np.flatnonzero(self.speed[:n] == 0)
+        if len(dead):
+            live_count = n - len(dead)
+            holes = dead[dead < live_count]
+            movers = np.flatnonzero(self.speed[live_count:n]) + live_count
+            for array in (self.pos, self.previous, self.direction, self.speed):
+                array[holes] = array[movers]
+            self.count = live_count
+
+    def render(self, surf, offset=(0, 0), outlines=None, alpha=1):
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n] if alpha == 1 else self.previous[:n] + (self.pos[:n] - self.previous[:n]) * alpha
+        center = pos - offset
+        length = self.direction[:n] * (self.speed[:n, None] * 3) # Along the spark
+        width = self.direction[:n, ::-1] * (self.speed[:n, None] * 0.5) * (-1, 1) # Across it, the direction turned a quarter
+        points = np.stack((center + length, center + width, center - length, center - width), axis=1)
+        for polygon in points.tolist():
+            pygame.draw.polygon(surf, (255, 255, 255), polygon)
+
+        if outlines is not None and outlines.enabled:
+            # Sparks are shapes rather than images, so their silhouettes are drawn straight onto the batch surface
+            scratch = outlines.batch_surface()
+            outlines.outline_batch([pygame.draw.polygon(scratch, OUTLINE_COLOR, polygon) for polygon in points.tolist()])
\ No newline at end of file
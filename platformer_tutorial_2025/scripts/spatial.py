@@ -0,0 +1,78 @@
+class SpatialHash:
+    '''
+    Uniform grid of buckets for finding things by their pixel bounds.
+
+    Items are tracked by identity, so unhashable things (like tile dicts) work too. Queries return
+    matches in the order they were first inserted, which keeps draw order stable for anything rendered from it.
+    Moving an item (inserting it again) keeps its place in that order.
+    '''
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {} # Bucket coordinates -> list of item ids
+        self.items = {} # Item id -> (insertion number, item, rect)
+        self.inserted = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell_range(self, rect):
+        # Bucket coordinates covered by a rect. Right and bottom edges are exclusive, nudged in a hair so FRects work too
+        size = self.cell_size
+        right = max(rect.left, rect.right - 0.000001)
+        bottom = max(rect.top, rect.bottom - 0.000001)
+        return (int(rect.left // size), int(rect.top // size), int(right // size), int(bottom // size))
+
+    def insert(self, item, rect):
+        if id(item) in self.items:
+            order = self.items[id(item)][0]
+            self.remove(item)
+        else:
+            order = self.inserted
+            self.inserted += 1
+        self.items[id(item)] = (order, item, rect)
+        left, top, right, bottom = self._cell_range(rect)
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                if (cx, cy) in self.cells:
+                    self.cells[(cx, cy)].append(id(item))
+                else:
+                    self.cells[(cx, cy)] = [id(item)]
+
+    def remove(self, item):
+        entry = self.items.pop(id(item), None)
+        if entry is None:
+            return False
+        left, top, right, bottom = self._cell_range(entry[2])
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                bucket = self.cells[(cx, cy)]
+                bucket.remove(id(item))
+                if not bucket:
+                    del self.cells[(cx, cy)]
+        return True
+
+    def clear(self):
+        self.cells = {}
+        self.items = {}
+        self.inserted = 0
+
+    def query(self, rect):
+        # Every item whose rect overlaps the given rect
+        found = set()
+        left, top, right, bottom = self._cell_range(rect)
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                if (cx, cy) in self.cells:
+                    found.update(self.cells[(cx, cy)])
+        entries = [self.items[item_id] for item_id in found]
+        entries.sort(key=lambda entry: entry[0])
+        return [item for order, item, item_rect in entries if item_rect.colliderect(rect)]
+
+    def query_point(self, pos):
+        # Every item whose rect contains the given point
+        bucket = self.cells.get((int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)))
+        if not bucket:
+            return []
+        entries = [self.items[item_id] for item_id in bucket]
+        entries.sort(key=lambda entry: entry[0])
+        return [item for order, item, item_rect in entries if item_rect.collidepoint(pos)]
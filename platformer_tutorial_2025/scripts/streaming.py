@@ -0,0 +1,161 @@
+from collections import OrderedDict
+import queue
+import threading
+from scripts.chunk import CHUNK_CELLS, CHUNK_SIZE
+
+STREAM_RADIUS = 2 # Chunks kept resident in every direction around the camera
+STREAM_MEMORY_BUDGET = 16 * 1024 * 1024 # Bytes of chunk data + cached renders allowed before far chunks get evicted
+CHUNK_ARRAY_BYTES = 2 * 2 * CHUNK_CELLS # Type + variant arrays, 2 bytes per cell each
+
+class ChunkStreamer:
+    '''
+    Keeps only the chunks around the camera resident in a Tilemap, reading the rest from a memory-mapped MapFile.
+
+    Chunks one ring past the resident radius are decoded ahead of time on a background thread. Anything the
+    Tilemap asks for that isn't resident (e.g. a collision check far from the camera) is loaded on the spot,
+    so queries always see the real map. When over the memory budget, the least recently used chunks outside
+    the radius are evicted. Tiles removed while streaming (like spawners pulled out at load) are remembered per chunk
+    and removed again whenever the chunk is decoded, so their chunks can still be evicted. Chunks that get tiles
+    placed while streaming are pinned, since evicting them would lose the change.
+    '''
+    def __init__(self, tilemap, map_file, radius=STREAM_RADIUS, memory_budget=STREAM_MEMORY_BUDGET):
+        self.tilemap = tilemap
+        self.map_file = map_file
+        self.radius = radius
+        self.memory_budget = memory_budget
+
+        self.last_used = OrderedDict() # Resident chunk coordinates, least recently used first
+        self.pinned = set()
+        self.removed = {} # Chunk coordinates -> indexes of cells removed since the file was written
+        self.pending = set() # Chunk coordinates requested from the background thread
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._prefetch, daemon=True)
+        self.thread.start()
+
+    def _prefetch(self):
+        # Background thread: decode requested chunks. Adopting them into the Tilemap happens on the main thread
+        while True:
+            coords = self.requests.get()
+            if coords is None:
+                return
+            self.results.put((coords, self.map_file.read_chunk(coords[0], coords[1])))
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.map_file.close()
+
+    def _decode(self, coords, chunk):
+        # Chunk read from the file -> chunk for the Tilemap, minus the cells removed from it since
+        chunk = self.tilemap.import_chunk(chunk, self.map_file.tile_types)
+        for index in self.removed.get(coords, ()):
+            chunk.clear(index)
+        return chunk
+
+    def _adopt(self, coords, chunk):
+        chunk = self._decode(coords, chunk)
+        self.tilemap.chunks[coords] = chunk
+        self.last_used[coords] = True
+        return chunk
+
+    def load(self, coords):
+        # Load a chunk right now. Returns None if the map has no chunk there
+        if coords not in self.map_file.chunk_offsets:
+            return None
+        chunk = self.tilemap.chunks.get(coords)
+        if chunk is None:
+            chunk = self._adopt(coords, self.map_file.read_chunk(coords[0], coords[1]))
+        return chunk
+
+    def peek(self, coords):
+        # The chunk at coords without making it resident. Non-resident chunks are decoded but not kept
+        chunk = self.tilemap.chunks.get(coords)
+        if chunk is None and coords in self.map_file.chunk_offsets:
+            chunk = self._decode(coords, self.map_file.read_chunk(coords[0], coords[1]))
+        return chunk
+
+    def pin(self, coords):
+        self.pinned.add(coords)
+        self.last_used[coords] = True
+
+    def remove_cell(self, coords, index):
+        if coords in self.removed:
+            self.removed[coords].add(index)
+        else:
+            self.removed[coords] = {index}
+
+    def all_chunks(self):
+        # Every chunk in the map, resident or not. Non-resident chunks are decoded but not kept
+        for coords in self.map_file.chunk_offsets:
+            yield self.peek(coords)
+        for coords in self.pinned - set(self.map_file.chunk_offsets): # Chunks created while streaming
+            yield self.tilemap.chunks[coords]
+
+    def chunk_bytes(self, coords):
+        # Rough memory cost of a resident chunk
+        surf = self.tilemap.render_cache.get(coords)
+        if surf is None:
+            return CHUNK_ARRAY_BYTES
+        return CHUNK_ARRAY_BYTES + surf.get_bytesize() * surf.get_width() * surf.get_height()
+
+    def memory_used(self):
+        return sum(self.chunk_bytes(coords) for coords in self.last_used)
+
+    def center(self, scroll, view_size):
+        # Chunk coordinates of the middle of the camera
+        size = self.tilemap.tile_size * CHUNK_SIZE
+        return (int((scroll[0] + view_size[0] / 2) // size), int((scroll[1] + view_size[1] / 2) // size))
+
+    def area(self, scroll, view_size):
+        # Chunk coordinates kept resident for a camera position, whether or not the map has tiles there
+        center_x, center_y = self.center(scroll, view_size)
+        return [(cx, cy) for cx in range(center_x - self.radius, center_x + self.radius + 1) for cy in range(center_y - self.radius, center_y + self.radius + 1)]
+
+    def update(self, scroll, view_size):
+        '''
+        Adopt prefetched chunks, request the ones coming into range and evict far ones when over budget
+        '''
+        center_x, center_y = self.center(scroll, view_size)
+
+        # Collect what the background thread finished
+        while True:
+            try:
+                coords, chunk = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(coords)
+            if coords not in self.tilemap.chunks: # May have been loaded on the spot in the meantime
+                self._adopt(coords, chunk)
+
+        # Keep everything in range fresh and queue up the ring just past it
+        reach = self.radius + 1
+        for cx in range(center_x - reach, center_x + reach + 1):
+            for cy in range(center_y - reach, center_y + reach + 1):
+                coords = (cx, cy)
+                if coords in self.tilemap.chunks:
+                    self.last_used.move_to_end(coords)
+                elif coords in self.map_file.chunk_offsets and coords not in self.pending:
+                    self.pending.add(coords)
+                    self.requests.put(coords)
+
+        # Evict least recently used chunks outside of the radius until we're under budget
+        used = self.memory_used()
+        for coords in list(self.last_used):
+            if used <= self.memory_budget:
+                break
+            if coords in self.pinned or (abs(coords[0] - center_x) <= self.radius and abs(coords[1] - center_y) <= self.radius):
+                continue
+            used -= self.chunk_bytes(coords)
+            del self.last_used[coords]
+            del self.tilemap.chunks[coords]
+            self.tilemap.render_cache.pop(coords, None)
+            self.tilemap.collision.evict_chunk(coords)
+
+        # Cached renders of spots with no grid chunk (offgrid decor, spill over from big tiles) are cheap to re-bake, so drop far ones too
+        for coords in list(self.tilemap.render_cache):
+            if coords not in self.tilemap.chunks and (abs(coords[0] - center_x) > reach or abs(coords[1] - center_y) > reach):
+                del self.tilemap.render_cache[coords]
+
+    def stats(self):
+        return {'resident': len(self.last_used), 'pinned': len(self.pinned), 'pending': len(self.pending), 'bytes': self.memory_used()}
@@ -1,5 +1,13 @@
+from array import array
 import json
+import math
+import numpy as np
 import pygame
+from scripts.chunk import CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE, Chunk, EMPTY, cell_index, chunk_coords
+from scripts.collision import CollisionMap
+from scripts.mapfile import MAP_EXTENSION, MapFile, write_map
+from scripts.spatial import SpatialHash
+from scripts.streaming import STREAM_MEMORY_BUDGET, STREAM_RADIUS, ChunkStreamer
 
     # Presorted tuple arrangements to determine the autotile system logic
 AUTOTILE_MAP = {
@@ -14,105 +22,486 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1), (-1, 0), (0, -1)])): 8
 }
 
+AUTOTILE_BITS = {(1, 0): 1, (-1, 0): 2, (0, -1): 4, (0, 1): 8} # Bit for each neighbor direction in an autotile neighbor mask
+AUTOTILE_LUT = [AUTOTILE_MAP.get(tuple(sorted(shift for shift, bit in AUTOTILE_BITS.items() if mask & bit)), -1) for mask in range(16)] # Neighbor mask -> variant. -1 leaves the tile as is
+
 
 NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, 1), (1, 0), (0, 0), (-1 , 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {'grass', 'stone'}
 AUTOTILE_TYPES = {'grass', 'stone'}
+OFFGRID_CELL_SIZE = 64 # Pixel size of the offgrid spatial index buckets
 
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game # Needed to pull assets
         self.tile_size = tile_size
-        self.tilemap = {} # Tracking all of the organized tiles that make up the map. Each tile is mapped using location as a key. Tiles without a map are assumed to be "empty space"
-        self.offgrid_tiles = [] # Tracking non-grid tiles. Components of this are the same as tilemap objects, but their position is calculated by pixel, not tile.
+        self.chunks = {} # Tracking all of the organized tiles that make up the map, grouped into Chunks keyed by integer chunk coordinates. Cells without a tile are assumed to be "empty space"
+        self.tile_types = [None] # Type id -> tile type name. Id 0 (EMPTY) is reserved
+        self.type_ids = {} # Tile type name -> type id
+        self.physics_ids = set() # Type ids of tiles in PHYSICS_TILES
+        self.autotile_ids = set() # Type ids of tiles in AUTOTILE_TYPES
+        self.offgrid_tiles = [] # Tracking non-grid tiles. Components of this are the same as grid tiles, but their position is calculated by pixel, not tile.
+        self.offgrid_lookup = None # SpatialHash of offgrid tiles by image bounds. Built on first use, see offgrid_index()
+        self.tile_index = {} # (type id, variant) -> set of tile positions of every grid tile with that id, streamed out or not
+        self.offgrid_ids = {} # (type, variant) -> list of offgrid tiles with that id
+        self.render_cache = {} # Chunk coordinates -> pre-composited Surface of every tile drawn in that chunk (None if nothing is drawn there)
+        self.streamer = None # Set while streaming a map, see stream()
+        self.collision = CollisionMap(self) # Merged rects of the physics tiles, used for entity collision
+
+    def type_id(self, tile_type):
+        # Get the integer id for a tile type, registering new types as they show up
+        if tile_type not in self.type_ids:
+            self.type_ids[tile_type] = len(self.tile_types)
+            self.tile_types.append(tile_type)
+            if tile_type in PHYSICS_TILES:
+                self.physics_ids.add(self.type_ids[tile_type])
+            if tile_type in AUTOTILE_TYPES:
+                self.autotile_ids.add(self.type_ids[tile_type])
+        return self.type_ids[tile_type]
+
+    def get_chunk(self, coords):
+        # The chunk at chunk coordinates, loading it first if it's been streamed out. None if there are no tiles there
+        chunk = self.chunks.get(coords)
+        if chunk is None and self.streamer is not None:
+            chunk = self.streamer.load(coords)
+        return chunk
+
+    def cell(self, x, y):
+        # Type id and variant of the tile at tile position (x, y). Type id is EMPTY for no tile
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            chunk = self.get_chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return (EMPTY, 0)
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK) # Same as cell_index(), inlined since this is called constantly
+        return (chunk.types[index], chunk.variants[index])
+
+    def type_at(self, x, y):
+        # Type id of the tile at tile position (x, y), without the variant
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            chunk = self.get_chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return EMPTY
+        return chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def tile_at(self, pos):
+        # Tile dict ({'type', 'variant', 'pos'}) at a tile position, or None
+        type_id, variant = self.cell(pos[0], pos[1])
+        if type_id != EMPTY:
+            return {'type': self.tile_types[type_id], 'variant': variant, 'pos': [pos[0], pos[1]]}
+
+    def set_tile(self, pos, tile_type, variant=0):
+        # Place (or replace) a grid tile at a tile position
+        x, y = int(pos[0]), int(pos[1])
+        coords = chunk_coords(x, y)
+        chunk = self.get_chunk(coords)
+        if chunk is None:
+            chunk = self.chunks[coords] = Chunk(coords[0], coords[1])
+        if self.streamer is not None:
+            self.streamer.pin(coords)
+        index = cell_index(x, y)
+        old_type, old_variant = chunk.types[index], chunk.variants[index]
+        type_id = self.type_id(tile_type)
+        if (old_type, old_variant) == (type_id, variant): # Nothing changed, keep the cached render
+            return
+        if old_type != EMPTY:
+            self.invalidate_tile(x, y, self.tile_types[old_type], old_variant)
+        if (old_type in self.physics_ids) != (type_id in self.physics_ids):
+            self.collision.invalidate_cell(x, y)
+        if old_type != EMPTY:
+            self.unindex_tile(x, y, old_type, old_variant)
+        chunk.set(index, type_id, variant)
+        self.index_tile(x, y, type_id, variant)
+        self.invalidate_tile(x, y, tile_type, variant)
+
+    def remove_tile(self, pos):
+        # Remove the grid tile at a tile position. Returns True if a tile was removed
+        x, y = int(pos[0]), int(pos[1])
+        coords = chunk_coords(x, y)
+        chunk = self.chunks.get(coords)
+        if chunk is None and self.streamer is not None: # No need to make it resident, the streamer remembers the removal (see below)
+            chunk = self.streamer.peek(coords)
+        if chunk is None:
+            return False
+        index = cell_index(x, y)
+        old_type, old_variant = chunk.types[index], chunk.variants[index]
+        if not chunk.clear(index):
+            return False
+        self.invalidate_tile(x, y, self.tile_types[old_type], old_variant)
+        if old_type in self.physics_ids:
+            self.collision.invalidate_cell(x, y)
+        self.unindex_tile(x, y, old_type, old_variant)
+        if self.streamer is not None: # Keep the change, even if the chunk ends up empty, so it isn't streamed back in from the file
+            self.streamer.remove_cell(coords, index)
+        elif not chunk.count: # Don't keep empty chunks around
+            del self.chunks[coords]
+        return True
+
+    def index_tile(self, x, y, type_id, variant):
+        if (type_id, variant) in self.tile_index:
+            self.tile_index[(type_id, variant)].add((x, y))
+        else:
+            self.tile_index[(type_id, variant)] = {(x, y)}
+
+    def unindex_tile(self, x, y, type_id, variant):
+        positions = self.tile_index[(type_id, variant)]
+        positions.discard((x, y))
+        if not positions:
+            del self.tile_index[(type_id, variant)]
+
+    def index_chunk(self, chunk):
+        for x, y, type_id, variant in chunk.cells():
+            self.index_tile(x, y, type_id, variant)
+
+    def index_offgrid(self):
+        # Rebuild the (type, variant) lookup after offgrid_tiles is replaced wholesale
+        self.offgrid_ids = {}
+        for tile in self.offgrid_tiles:
+            self.offgrid_ids.setdefault((tile['type'], tile['variant']), []).append(tile)
 
-    def extract(self, id_pairs, keep=False):
+    def offgrid_index(self):
+        # Built lazily since it needs the tile images (tools like convert_maps.py never render)
+        if self.offgrid_lookup is None:
+            self.offgrid_lookup = SpatialHash(OFFGRID_CELL_SIZE)
+            for tile in self.offgrid_tiles:
+                self.offgrid_lookup.insert(tile, self.offgrid_rect(tile))
+        return self.offgrid_lookup
+
+    def add_offgrid(self, tile):
+        self.offgrid_tiles.append(tile)
+        self.offgrid_ids.setdefault((tile['type'], tile['variant']), []).append(tile)
+        if self.offgrid_lookup is not None:
+            self.offgrid_lookup.insert(tile, self.offgrid_rect(tile))
+        self.invalidate_area(self.offgrid_rect(tile))
+
+    def remove_offgrid(self, tile):
+        self.offgrid_tiles.remove(tile)
+        same_id = self.offgrid_ids[(tile['type'], tile['variant'])]
+        same_id.remove(tile)
+        if not same_id:
+            del self.offgrid_ids[(tile['type'], tile['variant'])]
+        if self.offgrid_lookup is not None:
+            self.offgrid_lookup.remove(tile)
+        self.invalidate_area(self.offgrid_rect(tile))
+
+    def offgrid_in(self, rect):
+        # Offgrid tiles whose image overlaps a pixel area, in draw order
+        return self.offgrid_index().query(rect)
+
+    def offgrid_at(self, pos):
+        # Offgrid tiles whose image covers a pixel position, in draw order
+        return self.offgrid_index().query_point(pos)
+
+    def import_chunk(self, chunk, tile_types):
+        # Convert a chunk's type ids from another type table (e.g. a map file's) into this tilemap's ids
+        remap = [EMPTY] + [self.type_id(tile_type) for tile_type in tile_types[1:]]
+        if remap != list(range(len(remap))):
+            chunk.types = array('H', [remap[type_id] for type_id in chunk.types])
+        return chunk
+
+    def all_chunks(self):
+        # Every chunk in the map, including ones that are streamed out
+        if self.streamer is not None:
+            return self.streamer.all_chunks()
+        return self.chunks.values()
+
+    def tiles(self):
+        # Yield every grid tile as a dict. Positions are in tiles
+        for chunk in self.all_chunks():
+            for x, y, type_id, variant in chunk.cells():
+                yield {'type': self.tile_types[type_id], 'variant': variant, 'pos': [x, y]}
+
+    def tiles_in(self, rect):
+        # Yield every grid tile whose cell overlaps a pixel area
+        for x in range(int(rect.left // self.tile_size), math.ceil(rect.right / self.tile_size)):
+            for y in range(int(rect.top // self.tile_size), math.ceil(rect.bottom / self.tile_size)):
+                tile = self.tile_at((x, y))
+                if tile:
+                    yield tile
+
+    def clear(self):
+        if self.streamer is not None:
+            self.streamer.stop()
+            self.streamer = None
+        self.chunks = {}
+        self.tile_types = [None]
+        self.type_ids = {}
+        self.physics_ids = set()
+        self.autotile_ids = set()
+        self.offgrid_tiles = []
+        self.offgrid_lookup = None
+        self.tile_index = {}
+        self.offgrid_ids = {}
+        self.render_cache = {}
+        self.collision.clear()
+
+    def extract(self, id_pairs, keep=False, area=None):
         # Take a list of IDs (type + variant) and determine whether a tile is in that list
         # Keep allows us to remove the tile from the map
+        # Area (a pixel rect) limits the search to tiles overlapping it
+        id_pairs = list(dict.fromkeys(tuple(id_pair) for id_pair in id_pairs)) # Drop duplicates so tiles aren't matched twice
+        if area is None: # Straight from the (type, variant) indexes, so only matches are visited
+            offgrid_tiles = [tile for id_pair in id_pairs for tile in self.offgrid_ids.get(id_pair, [])]
+            grid_tiles = []
+            for tile_type, variant in id_pairs:
+                if tile_type in self.type_ids:
+                    for x, y in sorted(self.tile_index.get((self.type_ids[tile_type], variant), ())):
+                        grid_tiles.append({'type': tile_type, 'variant': variant, 'pos': [x, y]})
+        else:
+            offgrid_tiles = [tile for tile in self.offgrid_in(area) if (tile['type'], tile['variant']) in id_pairs]
+            grid_tiles = [tile for tile in self.tiles_in(area) if (tile['type'], tile['variant']) in id_pairs]
+
         matches = []
-        for tile in self.offgrid_tiles.copy(): # Copy required in case we're deleting later
-            if (tile['type'], tile['variant']) in id_pairs:
-                matches.append(tile.copy())
-                if not keep:
-                    self.offgrid_tiles.remove(tile)
-
-        for loc in self.tilemap.copy():
-            tile = self.tilemap[loc]
-            if (tile['type'], tile['variant']) in id_pairs:
-                matches.append(tile.copy())
-                matches[-1]['pos'] = matches[-1]['pos'].copy() # Copy so we can transform in the match
-                matches[-1]['pos'][0] *= self.tile_size # Change size for location in tiles
-                matches[-1]['pos'][1] *= self.tile_size 
-                if not keep:
-                    del self.tilemap[loc]
+        for tile in offgrid_tiles:
+            matches.append(tile.copy())
+            if not keep:
+                self.remove_offgrid(tile)
+
+        for tile in grid_tiles:
+            matches.append(tile)
+            if not keep:
+                self.remove_tile(tile['pos'])
+            tile['pos'][0] *= self.tile_size # Change size for location in tiles
+            tile['pos'][1] *= self.tile_size
         return matches
 
     def tiles_around(self, pos): # Find all tiles that collide with a given position
         tiles = []
         tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = self.tile_at((tile_loc[0] + offset[0], tile_loc[1] + offset[1]))
+            if tile:
+                tiles.append(tile)
         return tiles
     
     def save(self, path):
-        # Save existing tilemap to json
+        # Save existing tilemap to json, or the binary format for .map files
+        if path.endswith(MAP_EXTENSION):
+            write_map(path, self.tile_size, self.tile_types, self.all_chunks(), self.offgrid_tiles)
+            return
+
+        tilemap = {}
+        for tile in self.tiles():
+            tilemap[str(tile['pos'][0]) + ';' + str(tile['pos'][1])] = tile # Keyed by location to keep the original map format
         f = open(path, 'w')
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f)
+        json.dump({'tilemap': tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f)
         f.close()
 
-    def load(self, path):
-        # Load json formatted tilemap into editor
+    def load(self, path, autotile=False):
+        # Load json formatted tilemap into editor, or the binary format for .map files
+        # Autotile re-runs the autotiler over the whole map once it's loaded
+        if path.endswith(MAP_EXTENSION):
+            self.load_binary(path)
+        else:
+            self.load_json(path)
+        if autotile:
+            self.autotile()
+
+    def load_json(self, path):
         f = open(path, 'r')
         map_data = json.load(f)
         f.close()
 
-        self.tilemap = map_data['tilemap']
+        self.clear()
         self.tile_size = map_data['tile_size']
+        for tile in map_data['tilemap'].values():
+            self.set_tile(tile['pos'], tile['type'], tile['variant'])
         self.offgrid_tiles = map_data['offgrid']
+        self.index_offgrid()
+
+    def load_binary(self, path):
+        map_file = MapFile(path)
+        self.clear()
+        self.tile_size = map_file.tile_size
+        for cx, cy in map_file.chunk_offsets:
+            self.chunks[(cx, cy)] = self.import_chunk(map_file.read_chunk(cx, cy), map_file.tile_types)
+            self.index_chunk(self.chunks[(cx, cy)])
+        self.offgrid_tiles = map_file.offgrid_tiles()
+        self.index_offgrid()
+        map_file.close()
+
+    def stream(self, path, radius=STREAM_RADIUS, memory_budget=STREAM_MEMORY_BUDGET):
+        '''
+        Open a binary map for streaming. Only chunks near the camera are kept resident (see update_streaming)
+        '''
+        map_file = MapFile(path)
+        self.clear()
+        self.tile_size = map_file.tile_size
+        self.offgrid_tiles = map_file.offgrid_tiles()
+        self.index_offgrid()
+        self.streamer = ChunkStreamer(self, map_file, radius=radius, memory_budget=memory_budget)
+        for chunk in self.streamer.all_chunks(): # One pass over the whole file so the indexes cover chunks that aren't resident yet
+            self.index_chunk(chunk)
+
+    def update_streaming(self, scroll, view_size):
+        # Load/evict chunks as the camera moves. Does nothing when the whole map is loaded
+        if self.streamer is not None:
+            self.streamer.update(scroll, view_size)
 
     def solid_check(self, pos):
         # Check for a solid tile nearby and return it
-        tile_loc = str(int(pos[0] // self.tile_size )) + ';' + str(int(pos[1] // self.tile_size ))
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        if self.type_at(tile_loc[0], tile_loc[1]) in self.physics_ids:
+            return self.tile_at(tile_loc)
 
     def physics_rects_around(self, pos): # Find all rects that collide with a given position
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size)) # A single-tile sized rect
-        return rects
-    
+        # Merged rects shared between calls (see CollisionMap), so nothing is allocated per query
+        return self.collision.rects_around(pos)
+
+    def autotile_tile(self, x, y):
+        # Pick the variant for a single tile based on which of its neighbors share its type
+        chunk = self.get_chunk(chunk_coords(x, y))
+        if chunk is None:
+            return
+        index = cell_index(x, y)
+        type_id = chunk.types[index]
+        if type_id not in self.autotile_ids:
+            return
+        mask = 0
+        for (shift_x, shift_y), bit in AUTOTILE_BITS.items():
+            if self.type_at(x + shift_x, y + shift_y) == type_id: # Neighbor of the same type has been found
+                mask |= bit
+        variant = AUTOTILE_LUT[mask]
+        if variant != -1 and variant != chunk.variants[index]:
+            self.invalidate_tile(x, y, self.tile_types[type_id], chunk.variants[index])
+            self.unindex_tile(x, y, type_id, chunk.variants[index])
+            chunk.variants[index] = variant
+            self.index_tile(x, y, type_id, variant)
+            self.invalidate_tile(x, y, self.tile_types[type_id], variant)
+
+    def autotile_around(self, pos):
+        # Re-autotile the 3x3 neighborhood of a tile position, e.g. right after placing or removing a tile there
+        for shift_x in (-1, 0, 1):
+            for shift_y in (-1, 0, 1):
+                self.autotile_tile(int(pos[0]) + shift_x, int(pos[1]) + shift_y)
+
     def autotile(self):
-        # Get neighboring tiles to determine what the next one should be
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap: # Neighbor has been found
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
-
-
-    def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles: # Rendered first so tilemap takes precedence
-            # Tiles off grid have their position tracked by pixels, not tiles. So no need to multiply here
-            surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-
-
-        # Render only the tiles that could reasonably appear on the display by calculating number of tiles between camera position (top-left of display) and the bottom-right of the display and rendering tiles in that space
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ';' + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    # For the first argument - the type points to the assets, the variant says which file number we should be using. In this case we're using all 1.png files from the asset type
-                    # The second argument multiplies position by tile_size so the coordinates translate properly to the pixel distance on the screen
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
\ No newline at end of file
+        '''
+        Autotile every loaded tile at once. The neighbor masks for the whole map are built with NumPy array shifts instead of tile by tile
+        '''
+        chunks = list(self.chunks.values())
+        if not chunks:
+            return
+        min_cx = min(chunk.cx for chunk in chunks)
+        min_cy = min(chunk.cy for chunk in chunks)
+        width = (max(chunk.cx for chunk in chunks) - min_cx + 1) * CHUNK_SIZE
+        height = (max(chunk.cy for chunk in chunks) - min_cy + 1) * CHUNK_SIZE
+
+        # Dense grid of type ids with a border of empty cells so every tile has 4 neighbors to compare against
+        types = np.zeros((height + 2, width + 2), dtype=np.uint16)
+        for chunk in chunks:
+            x, y = (chunk.cx - min_cx) * CHUNK_SIZE + 1, (chunk.cy - min_cy) * CHUNK_SIZE + 1
+            types[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE] = np.frombuffer(chunk.types, dtype=np.uint16).reshape(CHUNK_SIZE, CHUNK_SIZE)
+
+        center = types[1:-1, 1:-1]
+        masks = ((types[1:-1, 2:] == center) * AUTOTILE_BITS[(1, 0)]
+            | (types[1:-1, :-2] == center) * AUTOTILE_BITS[(-1, 0)]
+            | (types[:-2, 1:-1] == center) * AUTOTILE_BITS[(0, -1)]
+            | (types[2:, 1:-1] == center) * AUTOTILE_BITS[(0, 1)])
+        variants = np.array(AUTOTILE_LUT)[masks]
+        update = np.isin(center, list(self.autotile_ids)) & (variants != -1)
+
+        # Write the new variants straight back into each chunk's array
+        for chunk in chunks:
+            x, y = (chunk.cx - min_cx) * CHUNK_SIZE, (chunk.cy - min_cy) * CHUNK_SIZE
+            chunk_variants = np.frombuffer(chunk.variants, dtype=np.uint16)
+            new_variants = variants[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE].ravel()
+            chunk_update = update[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE].ravel() & (new_variants != chunk_variants)
+            for index in np.flatnonzero(chunk_update).tolist(): # Only the changed cells need their (type, variant) index entry moved
+                tile_x, tile_y = chunk.cx * CHUNK_SIZE + (index & CHUNK_MASK), chunk.cy * CHUNK_SIZE + (index >> CHUNK_SHIFT)
+                self.unindex_tile(tile_x, tile_y, chunk.types[index], chunk.variants[index])
+                self.index_tile(tile_x, tile_y, chunk.types[index], int(new_variants[index]))
+            chunk_variants[chunk_update] = new_variants[chunk_update]
+        self.render_cache = {} # Variants may have changed anywhere
+
+    def tile_rect(self, x, y, tile_type, variant):
+        # Pixel area covered by a grid tile's image (some decor is bigger than a tile)
+        img = self.game.assets[tile_type][variant]
+        return pygame.Rect(x * self.tile_size, y * self.tile_size, img.get_width(), img.get_height())
+
+    def offgrid_rect(self, tile):
+        # Pixel area covered by an offgrid tile's image. Offgrid positions can be fractional
+        img = self.game.assets[tile['type']][tile['variant']]
+        return pygame.FRect(tile['pos'][0], tile['pos'][1], img.get_width(), img.get_height())
+
+    def invalidate_area(self, rect):
+        # Drop the cached render of every chunk overlapping a pixel area so it is re-baked on the next render
+        size = self.tile_size * CHUNK_SIZE
+        for cx in range(int(rect.left // size), int(rect.right // size) + 1):
+            for cy in range(int(rect.top // size), int(rect.bottom // size) + 1):
+                self.render_cache.pop((cx, cy), None)
+
+    def invalidate_tile(self, x, y, tile_type, variant):
+        if self.render_cache: # Nothing to invalidate while loading, so don't bother measuring the image
+            self.invalidate_area(self.tile_rect(x, y, tile_type, variant))
+
+    def bake_chunk(self, cx, cy):
+        '''
+        Composite every tile drawn within a chunk onto a single surface and cache it
+        '''
+        size = self.tile_size * CHUNK_SIZE
+        chunk_rect = pygame.Rect(cx * size, cy * size, size, size)
+        surf = None
+
+        # Offgrid positions are floored in world space so tiles spanning two chunks line up. Drawing one at a time used to
+        # truncate pos - offset toward zero instead, which put half pixel positions (like 113.5) 1px further right/down
+        # whenever they were off the left/top of the screen. Baked, they stay put no matter where the camera is
+        for tile in self.offgrid_in(chunk_rect): # Rendered first so tilemap takes precedence
+            if surf is None:
+                surf = pygame.Surface((size, size), pygame.SRCALPHA)
+            surf.blit(self.game.assets[tile['type']][tile['variant']], (math.floor(tile['pos'][0]) - chunk_rect.x, math.floor(tile['pos'][1]) - chunk_rect.y))
+
+        # Grid tile images can overflow to the right/bottom, so tiles from the chunks up and to the left may draw in here too
+        cells = []
+        for coords in [(cx - 1, cy - 1), (cx - 1, cy), (cx, cy - 1), (cx, cy)]:
+            chunk = self.get_chunk(coords)
+            if chunk is not None:
+                for x, y, type_id, variant in chunk.cells():
+                    if coords == (cx, cy) or chunk_rect.colliderect(self.tile_rect(x, y, self.tile_types[type_id], variant)):
+                        cells.append((x, y, type_id, variant))
+        cells.sort() # Column by column, the same order the tiles would be drawn one at a time
+        for x, y, type_id, variant in cells:
+            if surf is None:
+                surf = pygame.Surface((size, size), pygame.SRCALPHA)
+            surf.blit(self.game.assets[self.tile_types[type_id]][variant], (x * self.tile_size - chunk_rect.x, y * self.tile_size - chunk_rect.y))
+
+        self.render_cache[(cx, cy)] = surf
+        return surf
+
+    def bake(self, area=None):
+        '''
+        Pre-composite every chunk with something to draw, or just the chunk coordinates in area. Done up front so the first frames of a level don't stall
+        '''
+        if area is not None:
+            for cx, cy in area:
+                if (cx, cy) not in self.render_cache:
+                    self.bake_chunk(cx, cy)
+            return
+        size = self.tile_size * CHUNK_SIZE
+        coords = set()
+        for cx, cy in self.chunks:
+            coords.update([(cx, cy), (cx + 1, cy), (cx, cy + 1), (cx + 1, cy + 1)]) # Include chunks that oversized tiles may spill into
+        for tile in self.offgrid_tiles:
+            rect = self.offgrid_rect(tile)
+            for cx in range(int(rect.left // size), int(rect.right // size) + 1):
+                for cy in range(int(rect.top // size), int(rect.bottom // size) + 1):
+                    coords.add((cx, cy))
+        for cx, cy in coords:
+            if (cx, cy) not in self.render_cache:
+                self.bake_chunk(cx, cy)
+
+    def render(self, surf, offset=(0, 0), outlines=None):
+        # Blit the cached render of only the chunks that could reasonably appear on the display. Chunks are baked on first use
+        # With outlines (an Outlines), each chunk's outline gets drawn too. It's built once per baked chunk
+        size = self.tile_size * CHUNK_SIZE
+        for cx in range(offset[0] // size, (offset[0] + surf.get_width()) // size + 1):
+            for cy in range(offset[1] // size, (offset[1] + surf.get_height()) // size + 1):
+                if (cx, cy) in self.render_cache:
+                    chunk_surf = self.render_cache[(cx, cy)]
+                else:
+                    chunk_surf = self.bake_chunk(cx, cy)
+                if chunk_surf is not None:
+                    surf.blit(chunk_surf, (cx * size - offset[0], cy * size - offset[1]))
+                    if outlines is not None:
+                        outlines.draw(chunk_surf, (cx * size - offset[0], cy * size - offset[1]))
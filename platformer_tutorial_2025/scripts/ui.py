@@ -0,0 +1,104 @@
+import math
+import pygame
+
+class Widget:
+    '''
+    A piece of UI with its own surface. It's only redrawn when the state it shows (its key) changes
+    '''
+    def __init__(self, pos, size):
+        self.pos = pos
+        self.surf = pygame.Surface(size, pygame.SRCALPHA)
+        self.key = None # State the surface currently shows, None until first drawn
+
+    def update(self, key):
+        # Redraw for key if it's new. Returns True when the surface changed
+        if key == self.key:
+            return False
+        self.key = key
+        self.surf.fill((0, 0, 0, 0))
+        self.draw(self.surf, key)
+        return True
+
+    def draw(self, surf, key):
+        pass
+
+class UILayer:
+    '''
+    Composites widgets onto the UI surface, retained mode.
+
+    Owners call show() every frame they want a widget on screen, like they'd draw it. The surface is only cleared and
+    recomposited by render() when a widget's state changed or the set of shown widgets did, otherwise it's left as is.
+    '''
+    def __init__(self, surf):
+        self.surf = surf
+        self.shown = [] # Widgets shown this frame, in order
+        self.composited = [] # Widgets on the surface right now
+        self.rects = [] # Areas of the surface they cover, everything else is transparent
+        self.dirty = True
+        self.recomposites = 0
+
+    def show(self, widget, key):
+        if widget.update(key):
+            self.dirty = True
+        self.shown.append(widget)
+
+    def render(self):
+        if self.dirty or self.shown != self.composited:
+            self.surf.fill((0, 0, 0, 0))
+            for widget in self.shown:
+                self.surf.blit(widget.surf, widget.pos)
+            self.rects = [pygame.Rect(widget.pos, widget.surf.get_size()) for widget in self.shown]
+            self.composited, self.shown = self.shown, self.composited
+            self.dirty = False
+            self.recomposites += 1
+        self.shown.clear()
+
+class ShurikenWidget(Widget):
+    '''
+    Shows progress towards the next shuriken: the icon in a box, under a pie that fills up with the charge.
+
+    Its key is the charge ratio, 0 to 1.
+    '''
+    def __init__(self, pos, size, icon, radius):
+        super().__init__(pos, size)
+        self.icon = icon
+        self.radius = radius
+
+    def draw(self, surf, fill_ratio):
+        size_x, size_y = surf.get_size()
+
+        # Draw box
+        pygame.draw.rect(surf, (0, 0, 0), surf.get_rect()) # Box
+        pygame.draw.rect(surf, (100, 100, 100), surf.get_rect(), 2) # Outline
+
+        # Add icon
+        surf.blit(self.icon, (size_x // 2 - self.icon.get_width() // 2, size_y // 2 - self.icon.get_height() // 2))
+
+        # Calculate fill circle and apply
+        if fill_ratio > 0:
+            # Create surface w/ alpha for the circle
+            fill_circle = pygame.Surface((size_x, size_y), pygame.SRCALPHA)
+
+            # Calculate angle for filled ratio
+            fill_angle = fill_ratio * 360
+
+            # Draw filled segment
+            center = (size_x // 2, size_y // 2)
+
+            if fill_ratio >= 1.0:
+                # Draw full circle
+                pygame.draw.circle(fill_circle, (255, 255, 255, 100), center, self.radius)
+            else:
+                points = [center]
+                num_points = max(int(fill_angle / 5), 2)
+
+                for i in range(num_points + 1):
+                    angle = math.radians(-90 + (i * fill_angle / num_points))
+                    x = center[0] + self.radius * math.cos(angle)
+                    y = center[1] + self.radius * math.sin(angle)
+                    points.append((x, y))
+
+                if len(points) > 2:
+                    pygame.draw.polygon(fill_circle, (255, 255, 255, 100), points)
+
+            surf.blit(fill_circle, (0, 0))
\ No newline at end of file
@@ -16,16 +16,21 @@ def load_images(path):
         images.append(load_image(path + '/' + img_name))
     return images
 
+def flip_images(images):
+    # Mirrored (left-right) copies, made once so renderers never have to flip while drawing
+    return [pygame.transform.flip(img, True, False) for img in images]
+
 class Animation:
-    def __init__(self, images, img_dur=5, loop=True):
+    def __init__(self, images, img_dur=5, loop=True, flipped=None):
         self.images = images
+        self.flipped = flipped if flipped is not None else flip_images(images) # Every frame mirrored, shared by copies
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
     
     def update(self):
         if self.loop:
@@ -35,6 +40,6 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        return (self.flipped if flip else self.images)[int(self.frame / self.img_duration)]
     
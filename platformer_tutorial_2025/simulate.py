@@ -0,0 +1,40 @@
+'''
+Run the game headless (no window, no sound) as fast as possible. For soak testing and balance runs
+'''
+
+import argparse
+import random
+
+from game import Game
+from scripts.headless import ScriptedInput
+
+
+# Parse arguments for the simulation run
+parser = argparse.ArgumentParser(description='Headless simulation runner for the platformer game')
+parser.add_argument('--frames', type=int, default=10000, help='Number of simulation steps to run')
+parser.add_argument('--level', type=int, default=0, help='Level to start on')
+parser.add_argument('--script', type=str, help='Path to a json input script: a list of [frame, key name, "down"/"up"] entries')
+parser.add_argument('--random-input', action='store_true', help='Mash random keys instead of following a script')
+parser.add_argument('--seed', type=int, help='Random seed, for repeatable runs')
+parser.add_argument('--render', action='store_true', help='Render every frame too (offscreen)')
+parser.add_argument('--outlines', choices=['cached', 'mask'], default='cached', help='How outlines are drawn when rendering')
+args = parser.parse_args()
+
+random.seed(args.seed) # The game itself uses the random module
+game = Game(headless=True)
+game.outlines.enabled = args.outlines == 'cached'
+if args.level != game.state.level:
+    game.state.level = args.level
+    game.state.load_level(args.level)
+
+inputs = None
+if args.script:
+    inputs = ScriptedInput.from_file(args.script)
+elif args.random_input:
+    inputs = ScriptedInput.random(args.frames, seed=args.seed)
+
+steps_per_second = game.simulate(args.frames, inputs=inputs, render=args.render)
+print(f'{args.frames} frames at {steps_per_second:.0f} frames per second ({steps_per_second / 60:.1f}x realtime)')
+print(f'Level: {game.state.level}, player health: {game.player.health}, enemies left: {len(game.state.enemies)}, kills towards special: {game.player.kills}')
+for cls, pool in game.state.pools.items():
+    print(f'{cls.__name__} pool: {pool.stats()}')
\ No newline at end of file